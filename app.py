@@ -1,29 +1,101 @@
 import traceback
 import os
+import time
 import cv2
+import json
 import base64
+import threading
 import numpy as np
 from uuid import uuid4
-from multiprocessing import Process, Queue
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import requests as http
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+from flask_sock import Sock
 from dotenv import load_dotenv
 load_dotenv()
 
-# 모델 import
-from models.thumb_stt import find_best_thumbnail, analyze_video_content
-from models.face_arrange import analyze_face_from_frame
-from models.pet_daily import classify_media
-from models.pet_shorts import find_pet_segments, compile_pet_shorts
-
-# Worker queues
-stt_q = Queue()
-stt_res_q = Queue()
-pet_q = Queue()
-pet_res_q = Queue()
+# 모델(mediapipe 등)은 사용하는 핸들러 안에서 import
+# → spawn 으로 뜬 worker 가 이 모듈을 __mp_main__ 으로 다시 import 해도 모델은 로드하지 않음
+from workers.dispatcher import ResultDispatcher
+from workers.pool import WorkerPool, mp_context
+from utils.job_store import JobStore, STATUS_FAILED
+from utils.vision_cache import vision_cache
+from utils.shm_transport import SharedPayload
+from utils.uploads import (
+    UploadRequest, in_memory, is_image, upload_bytes, upload_path, keep_upload, file_ext,
+)
+
+# 큐 / dispatcher / 풀 / 작업 저장소는 start_workers() 에서 만든다.
+# (모듈 레벨에서 만들면 spawn worker 가 이 모듈을 import 할 때마다 같이 생성됨)
+stt_dispatcher = None
+pet_dispatcher = None
+face_dispatcher = None
+
+# Worker 풀 크기
+STT_WORKERS = int(os.getenv("STT_WORKERS", "2"))
+PET_WORKERS = int(os.getenv("PET_WORKERS", str(max((os.cpu_count() or 2) // 2, 1))))
+# 0 이면 FaceMesh 를 Flask 프로세스에서 실행 (세션별 tracking 사용)
+FACE_WORKERS = int(os.getenv("FACE_WORKERS", "0"))
+stt_pool = None
+pet_pool = None
+face_pool = None
+
+# 워커 결과 대기 최대 시간 (초)
+WORKER_RESULT_TIMEOUT = float(os.getenv("WORKER_RESULT_TIMEOUT", "900"))
+FACE_RESULT_TIMEOUT = float(os.getenv("FACE_RESULT_TIMEOUT", "5"))
+
+
+def wait_worker_result(dispatcher, task, timeout=None):
+    """
+    작업 제출 후 같은 id의 결과만 기다린다. 타임아웃 시 TimeoutError
+    """
+    timeout = timeout or WORKER_RESULT_TIMEOUT
+    future = dispatcher.submit(task)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        dispatcher.discard(task["id"])
+        raise TimeoutError(f"worker timeout ({timeout:.0f}s)")
+
+
+def analyze_face(frame, session_id=None):
+    """
+    FACE_WORKERS > 0 이면 디코딩된 프레임을 공유 메모리로 face worker 에 넘겨
+    landmark 만 받아오고, 세션 상태 판정은 이 프로세스에서 한다.
+    """
+    from models.face_arrange import (
+        analyze_face_from_frame, analyze_face_landmarks, resize_for_inference,
+    )
+
+    if face_pool is None:
+        return analyze_face_from_frame(frame, session_id)
+
+    with SharedPayload.from_array(resize_for_inference(frame)) as payload:
+        result = wait_worker_result(
+            face_dispatcher, {"id": uuid4().hex, "frame": payload.descriptor},
+            timeout=FACE_RESULT_TIMEOUT,
+        )
+
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    return analyze_face_landmarks(result["points"], session_id)
+
+# 비동기 작업 저장소 + 업로드 보관 위치 (재시작 후 재처리용)
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs/jobs.db")
+JOB_UPLOAD_DIR = os.getenv("JOB_UPLOAD_DIR", "jobs/uploads")
+# queued 작업 만료 확인 주기 (초) - WORKER_RESULT_TIMEOUT 이 지나면 실패 처리
+JOB_SWEEP_INTERVAL = float(os.getenv("JOB_SWEEP_INTERVAL", "60"))
+job_store = None
+
+# 완료 콜백(webhook) 전송용 스레드 (dispatcher 스레드를 막지 않도록)
+callback_executor = None
 
 app = Flask(__name__)
+# 작은 업로드는 메모리, 큰 업로드는 scratch 디렉토리에 바로 저장 (요청 종료 시 삭제)
+app.request_class = UploadRequest
 CORS(app)
+sock = Sock(app)
 
 
 # ============================================================
@@ -34,6 +106,9 @@ def face_arrange_api():
     print("\n📌 [DEBUG] /face_arrange 호출됨")
 
     try:
+        # 세션 id (카메라 클라이언트별 tracking 상태 분리)
+        session_id = request.headers.get("X-Session-Id") or request.form.get("session_id")
+
         # 이미지 읽기
         if "file" in request.files:
             img_bytes = request.files["file"].read()
@@ -43,6 +118,8 @@ def face_arrange_api():
                 print("❌ [ERROR] image(base64) 또는 file 없음")
                 return jsonify({"error": "image(base64) or file required"}), 400
 
+            session_id = session_id or data.get("session_id")
+
             try:
                 img_bytes = base64.b64decode(data["image"])
             except:
@@ -57,7 +134,7 @@ def face_arrange_api():
             return jsonify({"error": "image decode failed"}), 400
 
         # 얼굴 분석
-        result = analyze_face_from_frame(frame)
+        result = analyze_face(frame, session_id)
         print(f"📌 [DEBUG] 분석 결과: {result}")
 
         return jsonify(result)
@@ -68,6 +145,79 @@ def face_arrange_api():
         return jsonify({"error": str(e)}), 500
 
 
+# ============================================================
+# 1-1) 얼굴 정렬 (WebSocket 스트리밍)
+# ============================================================
+# 현재 WebSocket 이 연결된 session_id (같은 id 로 두 연결이 서로의 세션을 지우지 않도록)
+ws_session_ids = set()
+ws_session_lock = threading.Lock()
+
+
+@sock.route("/ws/face_arrange")
+def face_arrange_ws(ws):
+    """
+    binary JPEG 프레임을 연속으로 받아 프레임마다 결과(JSON)를 push.
+    처리보다 빨리 들어온 프레임은 버리고 가장 최신 프레임만 분석한다.
+    """
+    session_id = request.args.get("session_id") or uuid4().hex
+
+    with ws_session_lock:
+        duplicate = session_id in ws_session_ids
+        if not duplicate:
+            ws_session_ids.add(session_id)
+
+    if duplicate:
+        print(f"❌ [ERROR] /ws/face_arrange 중복 session_id: {session_id}")
+        ws.send(json.dumps({"error": f"session_id already connected: {session_id}"}))
+        return
+
+    print(f"\n📌 [DEBUG] /ws/face_arrange 연결됨 (session={session_id})")
+
+    dropped = 0
+
+    try:
+        while True:
+            data = ws.receive()
+
+            # 밀려 있는 프레임은 건너뛰고 최신 프레임만 사용
+            while True:
+                newer = ws.receive(timeout=0)
+                if newer is None:
+                    break
+                data = newer
+                dropped += 1
+
+            if isinstance(data, str):
+                try:
+                    data = base64.b64decode(data)
+                except Exception:
+                    ws.send(json.dumps({"error": "base64 decode failed"}))
+                    continue
+
+            frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                ws.send(json.dumps({"error": "image decode failed"}))
+                continue
+
+            try:
+                result = analyze_face(frame, session_id)
+            except Exception as e:
+                # 한 프레임 실패로 연결을 끊지 않음 (/face_arrange 와 같은 에러 응답)
+                print("\n🔥🔥🔥 [EXCEPTION in /ws/face_arrange]")
+                traceback.print_exc()
+                ws.send(json.dumps({"error": str(e)}))
+                continue
+
+            ws.send(json.dumps(dict(result, dropped=dropped)))
+
+    finally:
+        from models.face_arrange import face_sessions
+        face_sessions.remove(session_id)
+        with ws_session_lock:
+            ws_session_ids.discard(session_id)
+        print(f"📌 [DEBUG] /ws/face_arrange 종료 (session={session_id}, dropped={dropped})")
+
+
 # ============================================================
 # 2) 썸네일 추출
 # ============================================================
@@ -79,16 +229,15 @@ def thumbnail_api():
         print("❌ [ERROR] video 없음")
         return jsonify({"error": "No video provided"}), 400
 
-    temp_path = f"temp_{uuid4().hex}.mp4"
-    request.files["video"].save(temp_path)
-    print(f"📌 [DEBUG] 저장된 파일: {temp_path}")
+    temp_path = upload_path(request.files["video"])
+    print(f"📌 [DEBUG] 업로드 파일: {temp_path}")
+
+    from models.thumb_stt import find_best_thumbnail
 
     try:
         result = find_best_thumbnail(temp_path)
         print(f"📌 [DEBUG] 썸네일 분석 결과: {result}")
 
-        os.remove(temp_path)
-
         if not result:
             print("❌ [ERROR] find_best_thumbnail() 결과 없음")
             return jsonify({"error": "No valid thumbnail"}), 500
@@ -98,8 +247,6 @@ def thumbnail_api():
     except Exception as e:
         print("\n🔥🔥🔥 [EXCEPTION in /thumbnail]")
         traceback.print_exc()
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
         return jsonify({"error": str(e)}), 500
 
 
@@ -119,38 +266,27 @@ def stt_api():
         print("❌ [ERROR] API Key 없음")
         return jsonify({"error": "Missing API Key"}), 400
 
-    file = request.files["video"]
-    filename = file.filename or "upload.webm"
-
-    # 확장자 추출
-    if "." in filename:
-        ext = filename.rsplit(".", 1)[-1].lower()
-    else:
-        ext = "webm"
-
     task_id = uuid4().hex
-    temp_path = f"temp_{task_id}.{ext}"
-    file.save(temp_path)
-    print(f"📌 [DEBUG] STT 파일 저장: {temp_path}")
+    temp_path = upload_path(request.files["video"], default_ext="webm")
+    print(f"📌 [DEBUG] STT 업로드 파일: {temp_path}")
 
     try:
-        stt_q.put({"id": task_id, "path": temp_path, "api_key": api_key})
-        print("📌 [DEBUG] STT 작업 큐에 전달 완료")
-
-        result = stt_res_q.get()
+        result = wait_worker_result(
+            stt_dispatcher, {"id": task_id, "path": temp_path, "api_key": api_key}
+        )
         print(f"📌 [DEBUG] STT 결과: {result}")
 
         return jsonify(result)
 
+    except TimeoutError as e:
+        print(f"❌ [ERROR] STT 결과 대기 시간 초과: {task_id}")
+        return jsonify({"error": str(e)}), 504
+
     except Exception as e:
         print("\n🔥🔥🔥 [EXCEPTION in /stt]")
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-
 
 # ============================================================
 # 4) 반려동물 DAILY
@@ -165,19 +301,23 @@ def pet_daily_api():
 
     try:
         file = request.files["file"]
-        ext = file.filename.split(".")[-1]
-        temp_path = f"temp_{uuid4().hex}.{ext}"
-        file.save(temp_path)
 
-        pet_q.put({"mode": "daily", "path": temp_path})
-        print("📌 [DEBUG] daily worker 전달 완료")
+        # 작은 사진은 파일로 쓰지 않고 내용을 task 에 담아 전달 (큐로 복사, 4MB 이하)
+        if in_memory(file) and is_image(file.filename):
+            result = wait_worker_result(pet_dispatcher, {
+                "mode": "daily", "filename": file.filename, "content": upload_bytes(file),
+            })
+        else:
+            result = wait_worker_result(pet_dispatcher, {"mode": "daily", "path": upload_path(file)})
 
-        result = pet_res_q.get()
         print(f"📌 [DEBUG] daily 결과: {result}")
 
-        os.remove(temp_path)
         return jsonify(result)
 
+    except TimeoutError as e:
+        print("❌ [ERROR] /pet_daily 결과 대기 시간 초과")
+        return jsonify({"error": str(e)}), 504
+
     except Exception as e:
         print("\n🔥🔥🔥 [EXCEPTION in /pet_daily]")
         traceback.print_exc()
@@ -196,39 +336,244 @@ def detect_api():
         return jsonify({"error": "No video provided"}), 400
 
     try:
-        temp_path = f"temp_{uuid4().hex}.mp4"
-        request.files["video"].save(temp_path)
+        temp_path = upload_path(request.files["video"])
 
-        pet_q.put({"mode": "shorts", "path": temp_path})
-        print("📌 [DEBUG] shorts worker 전달 완료")
-
-        result = pet_res_q.get()
+        result = wait_worker_result(pet_dispatcher, {"mode": "shorts", "path": temp_path})
         print(f"📌 [DEBUG] shorts 결과: {result}")
 
-        os.remove(temp_path)
         return jsonify(result)
 
+    except TimeoutError as e:
+        print("❌ [ERROR] /detect 결과 대기 시간 초과")
+        return jsonify({"error": str(e)}), 504
+
     except Exception as e:
         print("\n🔥🔥🔥 [EXCEPTION in /detect]")
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
 
+# ============================================================
+# 6) 비동기 작업 API (/stt, /detect, /pet_daily)
+# ============================================================
+JOB_KINDS = {
+    "stt": "stt",
+    "detect": "pet",
+    "pet_daily": "pet",
+}
+
+
+def send_job_callback(job_id, callback_url, status, result, retries=3):
+    for attempt in range(1, retries + 1):
+        try:
+            res = http.post(
+                callback_url,
+                json={"job_id": job_id, "status": status, "result": result},
+                timeout=10,
+            )
+            if res.status_code < 500:
+                return
+        except Exception as e:
+            print(f"⚠️ [JOB {job_id}] callback 실패 ({attempt}/{retries}): {e}")
+        time.sleep(2 ** attempt)
+
+
+def close_job(job_id, status, result, path, callback_url):
+    print(f"📌 [JOB {job_id}] {status}")
+
+    if path and os.path.exists(path):
+        os.remove(path)
+
+    if callback_url:
+        callback_executor.submit(send_job_callback, job_id, callback_url, status, result)
+
+
+def finish_job(job_id, future, path, callback_url):
+    # dispatcher 스레드의 done callback 이라 여기서 난 예외는 보이지 않으므로 직접 로그
+    try:
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {"id": job_id, "error": str(e)}
+
+        status = job_store.finish(job_id, result)
+        if status is None:
+            # 이미 만료 처리된 작업 (업로드 / 콜백도 그쪽에서 처리)
+            print(f"⚠️ [JOB {job_id}] 만료 후 도착한 결과 무시")
+            return
+
+        close_job(job_id, status, result, path, callback_url)
+
+    except Exception:
+        # queued 로 남은 작업은 expire_jobs() 가 실패 처리하고 업로드를 지운다
+        print(f"\n🔥🔥🔥 [EXCEPTION in finish_job {job_id}]")
+        traceback.print_exc()
+
+
+def job_dispatcher(kind):
+    return stt_dispatcher if JOB_KINDS[kind] == "stt" else pet_dispatcher
+
+
+def dispatch_job(job_id, kind, task, callback_url=None):
+    future = job_dispatcher(kind).submit(dict(task, id=job_id))
+    future.add_done_callback(
+        lambda f: finish_job(job_id, f, task.get("path"), callback_url)
+    )
+
+
+def expire_jobs():
+    """
+    WORKER_RESULT_TIMEOUT 이 지나도 queued 인 작업을 실패 처리
+    (worker 가 결과를 못 보냈거나 결과 저장에 실패한 경우)
+    """
+    error = f"worker timeout ({WORKER_RESULT_TIMEOUT:.0f}s)"
+    for job in job_store.expire(WORKER_RESULT_TIMEOUT, error):
+        job_dispatcher(job["kind"]).discard(job["id"])
+        close_job(
+            job["id"], STATUS_FAILED, {"id": job["id"], "error": error},
+            job["payload"].get("path"), job["callback_url"],
+        )
+
+
+def run_job_sweeper():
+    while True:
+        time.sleep(JOB_SWEEP_INTERVAL)
+        try:
+            expire_jobs()
+        except Exception:
+            print("\n🔥🔥🔥 [EXCEPTION in expire_jobs]")
+            traceback.print_exc()
+
+
+@app.route("/jobs/<kind>", methods=["POST"])
+def submit_job_api(kind):
+    print(f"\n📌 [DEBUG] /jobs/{kind} 호출됨")
+
+    if kind not in JOB_KINDS:
+        return jsonify({"error": f"Unknown job type: {kind}"}), 404
+
+    field = "file" if kind == "pet_daily" else "video"
+    if field not in request.files:
+        print(f"❌ [ERROR] {field} 없음")
+        return jsonify({"error": f"No {field} provided"}), 400
+
+    job_id = uuid4().hex
+    task = {}
+
+    if kind == "stt":
+        api_key = request.form.get("api_key")
+        if not api_key:
+            return jsonify({"error": "Missing API Key"}), 400
+        task["api_key"] = api_key
+    else:
+        task["mode"] = "daily" if kind == "pet_daily" else "shorts"
+
+    # 요청이 끝난 뒤에도 처리해야 하므로 scratch 업로드를 작업 디렉토리로 이동 (rename)
+    file = request.files[field]
+    ext = file_ext(file.filename, "mp4")
+    task["path"] = keep_upload(file, os.path.join(JOB_UPLOAD_DIR, f"{job_id}.{ext}"))
+
+    callback_url = request.form.get("callback_url")
+    job_store.create(job_id, kind, task, callback_url)
+    dispatch_job(job_id, kind, task, callback_url)
+
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job_api(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
+def resume_jobs():
+    """
+    재시작 전 끝나지 않은 작업을 다시 큐에 넣는다 (업로드 파일이 남아있는 경우만)
+    """
+    for job in job_store.unfinished():
+        task = job["payload"]
+
+        if not task.get("path") or not os.path.exists(task["path"]):
+            job_store.finish(job["id"], {"id": job["id"], "error": "Upload lost before processing"})
+            continue
+
+        print(f"📌 [JOB {job['id']}] 재시작 후 재처리")
+        job_store.requeue(job["id"])
+        dispatch_job(job["id"], job["kind"], task, job["callback_url"])
+
+
+# ============================================================
+# 7) Worker 상태 확인
+# ============================================================
+@app.route("/health", methods=["GET"])
+def health_api():
+    pools = {"stt": stt_pool, "pet": pet_pool, "face": face_pool}
+    status = {name: pool.health() if pool else [] for name, pool in pools.items()}
+    healthy = all(w["alive"] for workers in status.values() for w in workers)
+    return jsonify({
+        "healthy": healthy,
+        "workers": status,
+        "vision_cache": vision_cache.stats(),   # Flask 프로세스(/thumbnail) 기준
+    }), (200 if healthy else 503)
+
+
 # ============================================================
 # Worker 시작
 # ============================================================
 def start_workers():
     from workers.stt_worker import run_stt_worker
     from workers.pet_worker import run_pet_worker
+    from workers.face_worker import run_face_worker
+
+    global stt_pool, pet_pool, face_pool
+    global stt_dispatcher, pet_dispatcher, face_dispatcher
+    global job_store, callback_executor
+
+    job_store = JobStore(JOB_DB_PATH)
+    os.makedirs(JOB_UPLOAD_DIR, exist_ok=True)
+    callback_executor = ThreadPoolExecutor(max_workers=4)
+
+    # Worker queues
+    stt_q = mp_context.Queue()
+    stt_res_q = mp_context.Queue()
+    pet_q = mp_context.Queue()
+    pet_res_q = mp_context.Queue()
 
-    print("🔥 STT Worker started.")
-    Process(target=run_stt_worker, args=(stt_q, stt_res_q)).start()
+    # 결과 큐는 공유하되, task id로 요청별 결과를 매칭
+    stt_dispatcher = ResultDispatcher(stt_q, stt_res_q, name="stt")
+    pet_dispatcher = ResultDispatcher(pet_q, pet_res_q, name="pet")
 
-    print("🔥 Pet Worker started.")
-    Process(target=run_pet_worker, args=(pet_q, pet_res_q)).start()
+    # 작업 종류별 풀 크기 (환경변수로 조정)
+    stt_pool = WorkerPool(run_stt_worker, stt_q, stt_res_q, size=STT_WORKERS, name="stt")
+    stt_pool.start()
+
+    pet_pool = WorkerPool(run_pet_worker, pet_q, pet_res_q, size=PET_WORKERS, name="pet")
+    pet_pool.start()
+
+    if FACE_WORKERS > 0:
+        face_q = mp_context.Queue()
+        face_res_q = mp_context.Queue()
+        face_dispatcher = ResultDispatcher(face_q, face_res_q, name="face")
+        face_pool = WorkerPool(run_face_worker, face_q, face_res_q, size=FACE_WORKERS, name="face")
+        face_pool.start()
+        face_dispatcher.start()
+
+    stt_dispatcher.start()
+    pet_dispatcher.start()
+
+    resume_jobs()
+    threading.Thread(target=run_job_sweeper, name="job-sweeper", daemon=True).start()
 
 
 if __name__ == "__main__":
+    # 첫 요청이 모델 로딩을 기다리지 않도록 Flask 프로세스에서만 미리 import
+    import models.thumb_stt     # noqa: F401
+    import models.face_arrange  # noqa: F401
+    from utils.clients import warm_up_clients
+
     start_workers()
+    warm_up_clients()   # /thumbnail 은 Flask 프로세스에서 Vision 호출
     print("🚀 App Started on port 8000")
     app.run(host="0.0.0.0", port=8000)
@@ -3,157 +3,330 @@ import os
 os.environ["CUDA_VISIBLE_DEVICES"] = "-1"     # GPU 비활성화
 os.environ["MEDIAPIPE_DISABLE_GPU"] = "1"     # Mediapipe GPU 금지
 
+import time
+import threading
+from collections import OrderedDict
+
 import cv2
 import mediapipe as mp
 import numpy as np
 
+from utils.detector_pool import DetectorPool
+
 # ============================================
-# 0. Landmark 실패 카운터 + 마지막 상태
+# 0. Landmark 실패 기준 + 세션 설정
 # ============================================
-FAILED_LANDMARK_FRAMES = 0
 FAILED_THRESHOLD = 3
-LAST_STATE = "perfect"
+
+FACE_SESSION_IDLE_SEC = float(os.getenv("FACE_SESSION_IDLE_SEC", "60"))
+MAX_FACE_SESSIONS = int(os.getenv("MAX_FACE_SESSIONS", "64"))
+DEFAULT_SESSION_ID = "default"
 
 # ============================================
 # 1. FaceMesh 초기화
 # ============================================
+mp_face_mesh = mp.solutions.face_mesh
 
 
+def create_mesh_detector(static_image_mode=False):
+    return mp_face_mesh.FaceMesh(
+        max_num_faces=5,
+        refine_landmarks=False,
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5,
+        static_image_mode=static_image_mode
+    )
 
-mp_face_mesh = mp.solutions.face_mesh
-
-mesh_detector = mp_face_mesh.FaceMesh(
-    max_num_faces=5,
-    refine_landmarks=False,
-    min_detection_confidence=0.5,
-    min_tracking_confidence=0.5,
-    static_image_mode=False
-)
 
+# session_id 없는 요청은 tracking 없이 풀의 검출기로 병렬 처리
+FACEMESH_POOL_SIZE = int(os.getenv("FACEMESH_POOL_SIZE", str(os.cpu_count() or 1)))
+mesh_pool = DetectorPool(lambda: create_mesh_detector(static_image_mode=True), FACEMESH_POOL_SIZE)
 
 
 # ============================================
-# 2. 이목구비 체크
+# 1-1. 세션별 상태 (카메라 클라이언트마다 tracker + 실패 카운터)
 # ============================================
-def facial_features_visible(face):
-    key_ids = [1, 33, 263, 13]
-    visible = 0
-    for idx in key_ids:
-        lm = face.landmark[idx]
-        if 0 <= lm.x <= 1 and 0 <= lm.y <= 1:
-            visible += 1
-    return visible >= 3
+class FaceSession:
+    def __init__(self):
+        self._detector = None
+        self.failed_frames = 0
+        self.last_state = "perfect"
+        self.roi = None          # fast mode: 직전 얼굴 영역 (정규화 x0, y0, x1, y1)
+        self.roi_frames = 0
+        self.last_seen = time.monotonic()
+        self.lock = threading.Lock()
+        self.closed = False
+
+    @property
+    def detector(self):
+        # tracking 검출기는 session_id 로 처음 호출될 때 생성
+        if self._detector is None:
+            self._detector = create_mesh_detector()
+        return self._detector
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            if self._detector is not None:
+                self._detector.close()
+
+
+class FaceSessionStore:
+    """
+    session_id → FaceSession
+    오래 쓰지 않은 세션은 정리하고, 최대 개수를 넘으면 가장 오래된 세션부터 제거
+    """
+
+    def __init__(self, max_sessions=MAX_FACE_SESSIONS, idle_sec=FACE_SESSION_IDLE_SEC):
+        self.max_sessions = max_sessions
+        self.idle_sec = idle_sec
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        evicted = []
+
+        with self._lock:
+            now = time.monotonic()
+
+            # 1) idle 세션 정리
+            for sid, sess in list(self._sessions.items()):
+                if now - sess.last_seen > self.idle_sec:
+                    evicted.append(self._sessions.pop(sid))
+
+            session = self._sessions.get(session_id)
+            if session is None:
+                # 2) 개수 제한 → 가장 오래 사용하지 않은 세션 제거
+                while len(self._sessions) >= self.max_sessions:
+                    evicted.append(self._sessions.popitem(last=False)[1])
+                session = FaceSession()
+                self._sessions[session_id] = session
+
+            session.last_seen = now
+            self._sessions.move_to_end(session_id)
+
+        for sess in evicted:
+            sess.close()
+
+        return session
+
+    def remove(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            session.close()
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+face_sessions = FaceSessionStore()
+
 
 
 # ============================================
-# 3. 얼굴 크기 기반 필터링 (멀리 있는 사람 제거)
+# 2. 추론 해상도 / ROI 설정
 # ============================================
-def filter_front_faces(faces):
+# 0 이면 원본 해상도로 추론
+FACE_INFER_WIDTH = int(os.getenv("FACE_INFER_WIDTH", "640"))
+
+# fast mode: 세션의 이전 얼굴 영역(ROI)만 잘라서 풀 검출기로 추론
+FACE_FAST_MODE = os.getenv("FACE_FAST_MODE", "0") == "1"
+FACE_ROI_MARGIN = float(os.getenv("FACE_ROI_MARGIN", "0.5"))   # bbox 대비 여유 비율
+FACE_ROI_REFRESH = int(os.getenv("FACE_ROI_REFRESH", "10"))    # N 프레임마다 전체 화면 재검출
+
+KEY_IDS = [1, 33, 263, 13]          # 코, 양쪽 눈, 입
+EYE_IDS = [33, 133, 362, 263]
+
+
+def resize_for_inference(frame, width=None):
+    width = FACE_INFER_WIDTH if width is None else width
+    h, w = frame.shape[:2]
+    if not width or w <= width:
+        return frame
+    return cv2.resize(frame, (width, int(h * width / w)), interpolation=cv2.INTER_AREA)
+
+
+def landmarks_to_array(faces):
     """
-    faces 중 area >= 0.05 인 얼굴만 반환 (카메라 가까이 있는 얼굴만 사용)
+    FaceMesh 결과 → (얼굴 수, 468, 2) 정규화 좌표 배열 (얼굴 없으면 None)
     """
-    front_faces = []
-    for face in faces:
-        xs = [lm.x for lm in face.landmark]
-        ys = [lm.y for lm in face.landmark]
-        bw = max(xs) - min(xs)  # bounding width
-        bh = max(ys) - min(ys)  # bounding height
-        area = bw * bh
+    if not faces:
+        return None
+    return np.array(
+        [[(lm.x, lm.y) for lm in face.landmark] for face in faces],
+        dtype=np.float32,
+    )
 
-        if area >= 0.05:       # 🔥 이 값 이하이면 배경 사람
-            front_faces.append(face)
 
-    return front_faces
+def detect_landmarks(image):
+    """
+    풀 검출기(static mode)로 한 장 추론 → landmark 배열
+    """
+    rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    with mesh_pool.acquire() as detector:
+        results = detector.process(rgb)
+    return landmarks_to_array(results.multi_face_landmarks)
 
 
 # ============================================
-# 4. 얼굴 상태 분석 (여러 명 처리)
+# 3. ROI 재사용 추론 (fast mode)
 # ============================================
-def analyze_face(face):
+def expand_roi(points, margin=None):
+    margin = FACE_ROI_MARGIN if margin is None else margin
+    mins = points.min(axis=(0, 1))
+    maxs = points.max(axis=(0, 1))
+    pad = (maxs - mins) * margin
+    x0, y0 = np.clip(mins - pad, 0, 1)
+    x1, y1 = np.clip(maxs + pad, 0, 1)
+    return float(x0), float(y0), float(x1), float(y1)
+
+
+def detect_with_roi(session, image):
     """
-    하나의 얼굴에 대해 perfect/come_in/move_back 판정
+    이전 프레임 얼굴 주변만 잘라서 추론하고, 좌표는 전체 화면 기준으로 되돌린다.
+    ROI 에서 못 찾거나 FACE_ROI_REFRESH 프레임마다 전체 화면으로 재검출.
     """
-    xs = [lm.x for lm in face.landmark]
-    ys = [lm.y for lm in face.landmark]
-    min_x, max_x = min(xs), max(xs)
-    min_y, max_y = min(ys), max(ys)
+    h, w = image.shape[:2]
 
-    bw = max_x - min_x
-    bh = max_y - min_y
+    if session.roi is not None and session.roi_frames < FACE_ROI_REFRESH:
+        x0, y0, x1, y1 = session.roi
+        px0, py0 = int(x0 * w), int(y0 * h)
+        px1, py1 = max(int(x1 * w), px0 + 1), max(int(y1 * h), py0 + 1)
 
-    # 이목구비 가려지면 perfect 유지
-    if not facial_features_visible(face):
-        return "perfect"
+        points = detect_landmarks(image[py0:py1, px0:px1])
+        if points is not None:
+            points[..., 0] = (px0 + points[..., 0] * (px1 - px0)) / w
+            points[..., 1] = (py0 + points[..., 1] * (py1 - py0)) / h
+            session.roi_frames += 1
+            session.roi = expand_roi(points)
+            return points
 
-    # 너무 가까움
-    if bw > 0.70 or bh > 0.70:
-        return "move_back"
+    points = detect_landmarks(image)
+    session.roi_frames = 0
+    session.roi = expand_roi(points) if points is not None else None
+    return points
 
-    # 노출 비율
-    vis_x0 = np.clip(min_x, 0, 1); vis_x1 = np.clip(max_x, 0, 1)
-    vis_y0 = np.clip(min_y, 0, 1); vis_y1 = np.clip(max_y, 0, 1)
 
-    vis_w = (vis_x1 - vis_x0) / bw if bw > 0 else 0
-    vis_h = (vis_y1 - vis_y0) / bh if bh > 0 else 0
-    visible_ratio = min(vis_w, vis_h)
+# ============================================
+# 4. 얼굴별 판정 (모든 얼굴을 한 번에 계산)
+# ============================================
+def classify_faces(points):
+    """
+    points: (얼굴 수, 468, 2)
+    반환: 전경 얼굴(area >= 0.05)들의 상태 목록 (perfect / come_in / move_back)
+    """
+    mins = points.min(axis=1)
+    maxs = points.max(axis=1)
+    size = maxs - mins                      # (F, 2) bounding width / height
+
+    # 🔥 멀리 있는 사람(배경 인물) 제거
+    front = size[:, 0] * size[:, 1] >= 0.05
+    if not front.any():
+        return []
+
+    points, mins, maxs, size = points[front], mins[front], maxs[front], size[front]
 
-    if visible_ratio < 0.3:
-        return "come_in"
+    # 이목구비 4곳 중 3곳 이상 화면 안
+    key = points[:, KEY_IDS]
+    features_ok = ((key >= 0) & (key <= 1)).all(axis=2).sum(axis=1) >= 3
+
+    # 노출 비율
+    visible = np.clip(maxs, 0, 1) - np.clip(mins, 0, 1)
+    ratio = np.divide(visible, size, out=np.zeros_like(size), where=size > 0)
+    visible_ratio = ratio.min(axis=1)
 
     # 눈 높이
-    eye_ids = [33, 133, 362, 263]
-    eye_ys = [face.landmark[i].y for i in eye_ids]
-    avg_eye_y = sum(eye_ys) / len(eye_ys)
-    if avg_eye_y < 0.15:
-        return "come_in"
+    eye_y = points[:, EYE_IDS, 1].mean(axis=1)
+
+    # 이목구비 가려지면 perfect 유지 / 너무 가까움 / 화면 밖
+    move_back = features_ok & (size.max(axis=1) > 0.70)
+    come_in = features_ok & ~move_back & ((visible_ratio < 0.3) | (eye_y < 0.15))
 
-    return "perfect"
+    states = np.full(len(points), "perfect", dtype=object)
+    states[move_back] = "move_back"
+    states[come_in] = "come_in"
+    return list(states)
 
 
 # ============================================
 # 5. 메인 함수 (여러 얼굴 처리)
 # ============================================
-def analyze_face_from_frame(frame):
-    global FAILED_LANDMARK_FRAMES, LAST_STATE
+def analyze_face_from_frame(frame, session_id=None):
+    image = resize_for_inference(frame)
 
-    h, w, _ = frame.shape
-    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    results=mesh_detector.process(rgb)
+    # session_id 없음 → 풀 검출기로 병렬 처리, 카운터만 default 세션에 기록
+    if not session_id:
+        points = detect_landmarks(image)
 
+        session = face_sessions.get(DEFAULT_SESSION_ID)
+        with session.lock:
+            return evaluate_landmarks(session, points)
+
+    while True:
+        session = face_sessions.get(session_id)
+
+        # 같은 세션의 프레임은 순서대로 처리 (tracker 상태 공유)
+        with session.lock:
+            # 처리 직전에 정리된 세션이면 새로 받아서 다시 시도
+            if session.closed:
+                continue
+
+            if FACE_FAST_MODE:
+                points = detect_with_roi(session, image)
+            else:
+                rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+                results = session.detector.process(rgb)
+                points = landmarks_to_array(results.multi_face_landmarks)
+
+            return evaluate_landmarks(session, points)
+
+
+def analyze_face_landmarks(points, session_id=None):
+    """
+    다른 프로세스(face worker)에서 구한 landmark 로 세션 상태만 갱신
+    """
+    session = face_sessions.get(session_id or DEFAULT_SESSION_ID)
+    with session.lock:
+        return evaluate_landmarks(session, points)
+
+
+def evaluate_landmarks(session, points):
+    """
+    landmark 배열 → 세션 상태 갱신 + 안내 결과
+    (session.lock 을 잡은 상태에서 호출)
+    """
     # 0) landmark 실패 → idle 또는 come_in
-    if not results.multi_face_landmarks:
-        FAILED_LANDMARK_FRAMES += 1
+    if points is None or len(points) == 0:
+        session.failed_frames += 1
 
-        if FAILED_LANDMARK_FRAMES >= FAILED_THRESHOLD:
-            LAST_STATE = "come_in"
+        if session.failed_frames >= FAILED_THRESHOLD:
+            session.last_state = "come_in"
             return {"state": "come_in", "message": "화면 안으로 들어오세요", "is_good": False}
 
         return {"state": "idle", "message": "", "is_good": False}
 
     # 성공 → 실패 카운트 초기화
-    FAILED_LANDMARK_FRAMES = 0
+    session.failed_frames = 0
 
-    # 🔥 여러 얼굴 중 배경 인물 제거
-    front_faces = filter_front_faces(results.multi_face_landmarks)
+    states = classify_faces(points)
 
     # 전경 얼굴이 하나도 없으면 idle 처리
-    if len(front_faces) == 0:
+    if len(states) == 0:
         return {"state": "idle", "message": "", "is_good": False}
 
     # 🔥 여러 얼굴 있을 때 규칙:
     # 하나라도 come_in → come_in
     # 모두 move_back → move_back
     # 그 외 → perfect
-    states = [analyze_face(face) for face in front_faces]
-
     if "come_in" in states:
-        LAST_STATE = "come_in"
+        session.last_state = "come_in"
         return {"state": "come_in", "message": "화면 안으로 들어오세요", "is_good": False}
 
     if all(s == "move_back" for s in states):
-        LAST_STATE = "move_back"
+        session.last_state = "move_back"
         return {"state": "move_back", "message": "조금 뒤로 물러나세요", "is_good": False}
 
     # 전경에 perfect가 하나라도 있으면 perfect
-    LAST_STATE = "perfect"
+    session.last_state = "perfect"
     return {"state": "perfect", "message": "", "is_good": True}
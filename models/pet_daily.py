@@ -3,109 +3,78 @@
 """
 
 import os
-import cv2
 import mimetypes
-from google.cloud import vision
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.clients import get_vision_client
+from models.pet_vision import (
+    iter_frames, detect_pet_in_frame, detect_pets_in_frames, adaptive_pet_scan, find_first_pet,
+    PET_ADAPTIVE_SAMPLING,
+)
+
+# daily 피드는 유무만 필요 → 기본적으로 조기 종료
+PET_DAILY_EARLY_EXIT = os.getenv("PET_DAILY_EARLY_EXIT", "1") == "1"
 
 # ------------------------------------------------------
 # Vision API 초기화
 # ------------------------------------------------------
 def init_vision(project_id=None):
-    if project_id:
-        client_options = {"quota_project_id": project_id}
-        return vision.ImageAnnotatorClient(client_options=client_options)
-    return vision.ImageAnnotatorClient()
+    # 프로세스 내에서 project id 별로 1회만 생성 후 재사용
+    return get_vision_client(project_id)
 
 # ------------------------------------------------------
 # 사진 분석
 # ------------------------------------------------------
-def detect_pet_in_image(image_path, project_id=None):
+def detect_pet_in_image(image_path, project_id=None, content=None):
     client = init_vision(project_id)
 
-    with open(image_path, "rb") as f:
-        content = f.read()
-
-    image = vision.Image(content=content)
-    res = client.label_detection(image=image)
+    # 메모리로 받은 업로드는 파일을 다시 읽지 않음
+    if content is None:
+        with open(image_path, "rb") as f:
+            content = f.read()
 
-    pet_keywords = {"dog", "cat", "pet", "animal", "puppy", "kitten", "canidae"}
-    has_pet = any(label.description.lower() in pet_keywords and label.score >= 0.70
-                  for label in res.label_annotations)
+    # 같은 사진 재업로드 시 캐시된 라벨 사용
+    has_pet = detect_pet_in_frame(content, client)
 
     return {"file_type": "image", "is_pet_present": has_pet}
 
 # ------------------------------------------------------
-# 영상 → 1초당 1프레임 추출
-# ------------------------------------------------------
-def extract_frames(video_path, sec_per_frame=1.0):
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        raise RuntimeError(f"비디오 파일을 열 수 없습니다: {video_path}")
-
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    interval = max(int(fps * sec_per_frame), 1)
-
-    frames = []
-    idx = 0
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        if idx % interval == 0:
-            ok, buf = cv2.imencode(".jpg", frame)
-            if ok:
-                frames.append({"time_sec": idx / fps, "image_bytes": buf.tobytes()})
-        idx += 1
-
-    cap.release()
-    return frames
-
-# ------------------------------------------------------
-# 단일 프레임 반려동물 탐지
-# ------------------------------------------------------
-def detect_pet_in_frame(image_bytes, client):
-    image = vision.Image(content=image_bytes)
-    res = client.label_detection(image=image)
-
-    pet_keywords = {"dog", "cat", "pet", "animal", "puppy", "kitten", "canidae"}
-    return any(label.description.lower() in pet_keywords and label.score >= 0.70
-               for label in res.label_annotations)
-
-# ------------------------------------------------------
-# 영상 전체 분석 (병렬 처리)
+# 영상 전체 분석 (디코딩 + 배치 Vision 호출 스트리밍)
 # ------------------------------------------------------
-def detect_pet_in_video(video_path, project_id=None):
+def detect_pet_in_video(video_path, project_id=None, early_exit=False):
     client = init_vision(project_id)
-    frames = extract_frames(video_path, sec_per_frame=1.0)
-
-    results = []
-    max_workers = min(10, len(frames))
-
-    with ThreadPoolExecutor(max_workers=max_workers) as exe:
-        futures = [exe.submit(detect_pet_in_frame, f["image_bytes"], client)
-                   for f in frames]
-
-        for f, frame in zip(as_completed(futures), frames):
-            results.append({
-                "time_sec": frame["time_sec"],
-                "found": f.result()
-            })
 
-    pet_times = [r["time_sec"] for r in results if r["found"]]
+    if early_exit:
+        # 반려동물 유무만 필요 → 찾는 즉시 중단 (timestamps 에는 확인된 시각 1개)
+        pet_time = find_first_pet(video_path, client)
+        pet_times = [pet_time] if pet_time is not None else []
+        return {"file_type": "video", "is_pet_present": len(pet_times) > 0, "timestamps": pet_times}
+
+    if PET_ADAPTIVE_SAMPLING:
+        # 성긴 스캔 + 변화 구간만 세밀하게 (같은 장면은 Vision 호출 생략)
+        results = adaptive_pet_scan(video_path, client)
+    else:
+        # 디코딩과 Vision 배치 호출을 겹쳐서 진행 (결과는 프레임 순서대로)
+        frames = iter_frames(video_path, sec_per_frame=1.0)
+        results = [(frame["time_sec"], found)
+                   for frame, found in detect_pets_in_frames(frames, client)]
+
+    pet_times = [t for t, found in results if found]
     return {"file_type": "video", "is_pet_present": len(pet_times) > 0, "timestamps": pet_times}
 
 # ------------------------------------------------------
 # 파일 타입 자동 분기
 # ------------------------------------------------------
-def classify_media(file_path, project_id=None):
+def classify_media(file_path, project_id=None, early_exit=None, content=None):
+    """
+    content 를 주면 file_path 는 형식 판단(확장자)에만 사용
+    """
     mime, _ = mimetypes.guess_type(file_path)
 
     if mime and mime.startswith("image"):
-        return detect_pet_in_image(file_path, project_id)
+        return detect_pet_in_image(file_path, project_id, content=content)
 
     if mime and mime.startswith("video"):
-        return detect_pet_in_video(file_path, project_id)
+        if early_exit is None:
+            early_exit = PET_DAILY_EARLY_EXIT
+        return detect_pet_in_video(file_path, project_id, early_exit=early_exit)
 
     return {"error": "지원하지 않는 파일 형식입니다."}
@@ -1,174 +1,438 @@
 import os
-import cv2
+import json
 import uuid
+import hashlib
+import tempfile
 import subprocess
-import boto3
-from dotenv import load_dotenv
-from google.cloud import vision
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+from utils.frame_sampler import get_video_info
+from utils.clients import get_vision_client
+from utils.s3_upload import (
+    upload_file, upload_command_output, object_exists, object_url, delete_object,
+)
+from utils.shorts_index import ShortsIndex
+from models.pet_vision import (
+    iter_frames, detect_pets_in_frames, adaptive_pet_scan,
+    PET_ADAPTIVE_SAMPLING, ADAPTIVE_COARSE_SEC, ADAPTIVE_FINE_SEC,
+    SCENE_DIFF_THRESHOLD, PET_SCORE_THRESHOLD,
+)
+
+# 이미 분석 / 렌더링한 숏츠 인덱스 (같은 영상 재요청 시 바로 반환)
+SHORTS_INDEX_PATH = os.getenv("SHORTS_INDEX_PATH", "cache/shorts.db")
+shorts_index = ShortsIndex(SHORTS_INDEX_PATH)
 
 # ============================================================
-# 환경변수 로드
+# Google Vision 초기화
 # ============================================================
-load_dotenv()
-
-S3_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY_ID")
-S3_SECRET_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
-S3_BUCKET = os.getenv("AWS_BUCKET_NAME", "woorizip-local-files")
-S3_REGION = os.getenv("AWS_REGION", "ap-northeast-2")
-
-# boto3 클라이언트는 환경변수 자동 감지 가능 → credentials 생략해도 됨
-s3_client = boto3.client("s3", region_name=S3_REGION)
+def init_vision(project_id=None):
+    # 프로세스 내에서 project id 별로 1회만 생성 후 재사용
+    return get_vision_client(project_id)
 
 
 # ============================================================
-# Google Vision 초기화
+# 구간 생성 설정
 # ============================================================
-def init_vision(project_id=None):
-    if project_id:
-        return vision.ImageAnnotatorClient(client_options={"quota_project_id": project_id})
-    return vision.ImageAnnotatorClient()
+# 적응형 샘플링은 샘플 간격이 위치마다 다르므로 hysteresis 기준은 샘플 수가 아닌 초 단위
+SEGMENT_MIN_ON_SEC = float(os.getenv("PET_SEGMENT_MIN_ON_SEC", "0"))     # 이보다 짧은 탐지는 버림
+SEGMENT_MIN_OFF_SEC = float(os.getenv("PET_SEGMENT_MIN_OFF_SEC", "2.0"))  # 이보다 짧은 미탐지는 메움
+SEGMENT_MERGE_GAP = float(os.getenv("PET_SEGMENT_MERGE_GAP", "2.0"))
+SEGMENT_MIN_LEN = float(os.getenv("PET_SEGMENT_MIN_LEN", "1.0"))
+SEGMENT_MAX_LEN = float(os.getenv("PET_SEGMENT_MAX_LEN", "15.0"))
+SEGMENT_PADDING = float(os.getenv("PET_SEGMENT_PADDING", "0.5"))
+SHORTS_MAX_DURATION = float(os.getenv("SHORTS_MAX_DURATION", "60.0"))
+
+
+def _runs(flags):
+    """
+    bool 배열 → 같은 값이 이어지는 구간 (시작 idx, 길이, 값)
+    """
+    change = np.flatnonzero(np.diff(flags.astype(np.int8))) + 1
+    starts = np.concatenate(([0], change))
+    lengths = np.diff(np.concatenate((starts, [len(flags)])))
+    return starts, lengths, flags[starts]
+
+
+def build_segments(times, flags, sample_sec=1.0, duration=None,
+                   min_on=SEGMENT_MIN_ON_SEC, min_off=SEGMENT_MIN_OFF_SEC,
+                   merge_gap=SEGMENT_MERGE_GAP, min_len=SEGMENT_MIN_LEN,
+                   max_len=SEGMENT_MAX_LEN, padding=SEGMENT_PADDING,
+                   max_total=SHORTS_MAX_DURATION):
+    """
+    프레임별 탐지 결과 (times, flags) → 숏츠용 구간 [(start, end), ...]
+
+    구간 끝 = 다음 샘플 시각 (마지막 샘플이면 + sample_sec)
+
+    1) hysteresis: min_off 초 미만의 짧은 미탐지는 메우고, min_on 초 미만의 짧은 탐지는 버림
+       (길이는 샘플 수가 아니라 시각으로 계산 → 적응형 샘플링의 불균일 간격에서도 같은 기준)
+    2) 탐지 구간 경계
+    3) 앞뒤 padding → merge_gap 이하로 떨어진 구간 병합
+    4) 최대 길이로 자르고 최소 길이 미만은 제거
+    5) 전체 길이가 max_total 을 넘으면 긴 구간부터 채워서 예산 안에 맞춤
+    """
+    if len(times) == 0:
+        return []
+
+    order = np.argsort(times)
+    times = np.asarray(times, dtype=np.float64)[order]
+    flags = np.asarray(flags, dtype=bool)[order]
+    next_time = np.append(times[1:], times[-1] + sample_sec)
+
+    def run_seconds(starts, lengths):
+        return next_time[starts + lengths - 1] - times[starts]
+
+    # 1) hysteresis
+    starts, lengths, values = _runs(flags)
+    inner = (np.arange(len(starts)) > 0) & (np.arange(len(starts)) < len(starts) - 1)
+    fill = ~values & inner & (run_seconds(starts, lengths) < min_off)
+    for s, n in zip(starts[fill], lengths[fill]):
+        flags[s:s + n] = True
+
+    starts, lengths, values = _runs(flags)
+    drop = values & (run_seconds(starts, lengths) < min_on)
+    for s, n in zip(starts[drop], lengths[drop]):
+        flags[s:s + n] = False
+
+    starts, lengths, values = _runs(flags)
+    first = starts[values]
+    last = first + lengths[values] - 1
+    if len(first) == 0:
+        return []
+
+    # 2) 구간 경계
+    seg_start = times[first]
+    seg_end = next_time[last]
+
+    # 3) padding + 병합
+    seg_start = seg_start - padding
+    seg_end = seg_end + padding
+    seg_start = np.maximum(seg_start, 0.0)
+    if duration:
+        seg_end = np.minimum(seg_end, duration)
+
+    new_group = np.concatenate(([True], seg_start[1:] - seg_end[:-1] > merge_gap))
+    idx = np.flatnonzero(new_group)
+    seg_start = seg_start[idx]
+    seg_end = np.maximum.reduceat(seg_end, idx)
+
+    # 4) 최대 / 최소 길이
+    seg_end = np.minimum(seg_end, seg_start + max_len)
+    keep = seg_end - seg_start >= min_len
+    seg_start, seg_end = seg_start[keep], seg_end[keep]
+
+    # 5) 전체 길이 예산
+    lengths = seg_end - seg_start
+    if max_total and lengths.sum() > max_total:
+        remaining = max_total
+        for i in np.argsort(-lengths, kind="stable"):
+            take = min(lengths[i], remaining)
+            if take < min_len:
+                seg_end[i] = seg_start[i]
+                continue
+            seg_end[i] = seg_start[i] + take
+            remaining -= take
+
+        keep = seg_end - seg_start >= min_len
+        seg_start, seg_end = seg_start[keep], seg_end[keep]
+
+    return [(round(float(s), 3), round(float(e), 3)) for s, e in zip(seg_start, seg_end)]
 
 
 # ============================================================
-# 프레임 추출
+# 반려동물 구간 자동 탐색
 # ============================================================
-def extract_frames(video_path, sec_per_frame=1.0):
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        raise RuntimeError("비디오를 열 수 없습니다: " + video_path)
+def find_pet_segments(video_path, project_id=None, sec_per_frame=1.0):
+    client = init_vision(project_id)
 
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    interval = max(int(fps * sec_per_frame), 1)
+    if PET_ADAPTIVE_SAMPLING:
+        # 성긴 스캔 + 변화 구간만 세밀하게 → 경계는 더 정확, Vision 호출은 더 적게
+        results = adaptive_pet_scan(video_path, client)
+        sample_sec = ADAPTIVE_COARSE_SEC
+    else:
+        # 디코딩과 Vision 배치 호출을 겹쳐서 진행 (결과는 프레임 순서대로)
+        frames = iter_frames(video_path, sec_per_frame)
+        results = [(frame["time_sec"], has_pet)
+                   for frame, has_pet in detect_pets_in_frames(frames, client)]
+        sample_sec = sec_per_frame
 
-    frames = []
-    idx = 0
+    times = [t for t, _ in results]
+    flags = [has_pet for _, has_pet in results]
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
+    duration = get_video_info(video_path)["duration"]
+    return build_segments(times, flags, sample_sec=sample_sec, duration=duration)
 
-        if idx % interval == 0:
-            ok, buf = cv2.imencode(".jpg", frame)
-            if ok:
-                frames.append({
-                    "time_sec": idx / fps,
-                    "image_bytes": buf.tobytes(),
-                })
-        idx += 1
 
-    cap.release()
-    return frames
+# ============================================================
+# 내용 기반 키 (원본 해시 + 구간 + 설정)
+# ============================================================
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_key(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def detect_settings(sec_per_frame):
+    # 설정이 바뀌면 이전 탐지 결과는 쓰지 않음
+    return {
+        "adaptive": PET_ADAPTIVE_SAMPLING,
+        "coarse": ADAPTIVE_COARSE_SEC,
+        "fine": ADAPTIVE_FINE_SEC,
+        "scene": SCENE_DIFF_THRESHOLD,
+        "score": PET_SCORE_THRESHOLD,
+        "sec_per_frame": sec_per_frame,
+        "segment": [SEGMENT_MIN_ON_SEC, SEGMENT_MIN_OFF_SEC, SEGMENT_MERGE_GAP,
+                    SEGMENT_MIN_LEN, SEGMENT_MAX_LEN, SEGMENT_PADDING, SHORTS_MAX_DURATION],
+    }
+
+
+def find_pet_segments_cached(video_path, source_hash=None, project_id=None, sec_per_frame=1.0):
+    source_hash = source_hash or hash_file(video_path)
+    detect_key = content_key(source_hash, detect_settings(sec_per_frame))
+
+    segments = shorts_index.get_segments(detect_key)
+    if segments is not None:
+        print(f"⚡ 구간 탐지 캐시 사용 ({len(segments)}개 구간)")
+        return segments
+
+    segments = find_pet_segments(video_path, project_id, sec_per_frame)
+    shorts_index.put_segments(detect_key, segments)
+    return segments
 
 
 # ============================================================
-# 프레임별 반려동물 존재 감지
+# ffmpeg 설정 (재인코딩 시)
 # ============================================================
-def detect_pet_in_frame(image_bytes, client):
-    image = vision.Image(content=image_bytes)
-    res = client.label_detection(image=image)
+SHORTS_STREAM_COPY = os.getenv("SHORTS_STREAM_COPY", "1") == "1"
+SHORTS_KEYFRAME_TOLERANCE = float(os.getenv("SHORTS_KEYFRAME_TOLERANCE", "1.0"))
+SHORTS_PRESET = os.getenv("SHORTS_PRESET", "veryfast")
+SHORTS_CRF = os.getenv("SHORTS_CRF", "23")
+SHORTS_THREADS = os.getenv("SHORTS_THREADS", "0")   # 0 = ffmpeg 자동
 
-    keywords = {"dog", "cat", "pet", "puppy", "kitten", "animal", "canidae"}
-    for label in res.label_annotations:
-        if label.description.lower() in keywords and label.score >= 0.70:
-            return True
-    return False
+# ffmpeg 출력(fragmented MP4)을 로컬 파일 없이 바로 S3 multipart 업로드
+SHORTS_STREAM_UPLOAD = os.getenv("SHORTS_STREAM_UPLOAD", "1") == "1"
+PIPE_OUTPUT = "pipe:1"
+
+
+def run_ffmpeg(cmd):
+    proc = subprocess.run(cmd, capture_output=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg 실패: {proc.stderr.decode(errors='ignore')[-500:]}")
+
+
+def output_args(output_path):
+    if output_path == PIPE_OUTPUT:
+        # stdout 은 되감을 수 없으므로 moov 를 앞에 두는 fragmented MP4 로 출력
+        return ["-movflags", "frag_keyframe+empty_moov+default_base_moof", "-f", "mp4", PIPE_OUTPUT]
+    return ["-movflags", "+faststart", output_path]
 
 
 # ============================================================
-# 반려동물 구간 자동 탐색
+# 키프레임 / 오디오 정보 (ffprobe)
 # ============================================================
-def find_pet_segments(video_path, project_id=None):
-    client = init_vision(project_id)
-    frames = extract_frames(video_path)
-
-    results = []
-    with ThreadPoolExecutor(max_workers=min(10, len(frames))) as exe:
-        futures = [exe.submit(detect_pet_in_frame, f["image_bytes"], client) for f in frames]
-        for f, frame in zip(as_completed(futures), frames):
-            results.append({"time_sec": frame["time_sec"], "has_pet": f.result()})
-
-    results.sort(key=lambda x: x["time_sec"])
-
-    segments = []
-    in_seg = False
-    start = 0
-
-    for r in results:
-        if r["has_pet"] and not in_seg:
-            in_seg = True
-            start = r["time_sec"]
-        elif not r["has_pet"] and in_seg:
-            end = r["time_time"]
-            if end - start >= 0.5:
-                segments.append((start, end))
-            in_seg = False
-
-    if in_seg:
-        end = results[-1]["time_sec"]
-        if end - start >= 0.5:
-            segments.append((start, end))
+def probe_keyframes(video_path):
+    """
+    영상 스트림의 키프레임 시각 목록 (패킷 헤더만 읽음, 디코딩 없음)
+    """
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        video_path,
+    ]
+    out = subprocess.run(cmd, capture_output=True, check=True).stdout.decode()
 
-    return segments
+    keyframes = []
+    for line in out.splitlines():
+        parts = line.split(",")
+        if len(parts) >= 2 and "K" in parts[1] and parts[0] not in ("", "N/A"):
+            keyframes.append(float(parts[0]))
+
+    return sorted(keyframes)
+
+
+def has_audio(video_path):
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "a",
+        "-show_entries", "stream=index",
+        "-of", "csv=p=0",
+        video_path,
+    ]
+    out = subprocess.run(cmd, capture_output=True, check=True).stdout.decode()
+    return bool(out.strip())
+
+
+def snap_to_keyframes(segments, keyframes, tolerance=SHORTS_KEYFRAME_TOLERANCE):
+    """
+    구간 시작을 바로 앞 키프레임으로 당긴다.
+    tolerance 초 이내에 키프레임이 없는 구간이 있으면 None (재인코딩 필요)
+    """
+    snapped = []
+    for s, e in segments:
+        prev = [k for k in keyframes if k <= s + 1e-3]
+        if not prev or s - prev[-1] > tolerance:
+            return None
+        # 당긴 시작점이 앞 구간과 겹치면 같은 장면이 두 번 나오므로 재인코딩
+        if snapped and prev[-1] < snapped[-1][1]:
+            return None
+        snapped.append((prev[-1], e))
+    return snapped
 
 
 # ============================================================
-# ❗ 최종 숏츠 생성 + S3 업로드
+# 빠른 경로: 키프레임 단위 stream copy (concat demuxer)
 # ============================================================
-def compile_pet_shorts(video_path, segments):
-    if not segments:
-        raise ValueError("반려동물 구간이 없습니다.")
+def cut_stream_copy(video_path, segments, output_path, run=run_ffmpeg):
+    list_path = os.path.join(tempfile.gettempdir(), f"concat_{uuid.uuid4().hex}.txt")
+    src = os.path.abspath(video_path).replace("'", "'\\''")
+
+    with open(list_path, "w") as f:
+        f.write("ffconcat version 1.0\n")
+        for s, e in segments:
+            f.write(f"file '{src}'\ninpoint {s:.3f}\noutpoint {e:.3f}\n")
+
+    try:
+        return run([
+            "ffmpeg", "-y",
+            "-f", "concat", "-safe", "0",
+            "-i", list_path,
+            "-c", "copy",
+            "-avoid_negative_ts", "make_zero",
+            *output_args(output_path),
+        ])
+    finally:
+        if os.path.exists(list_path):
+            os.remove(list_path)
 
-    # 로컬 임시 파일명 (ffmpeg가 생성)
-    local_out_name = f"pet_shorts_{uuid.uuid4().hex[:10]}.mp4"
-    local_output_path = os.path.join("/tmp", local_out_name)
+
+# ============================================================
+# 느린 경로: trim + concat 재인코딩 (오디오 포함)
+# ============================================================
+def cut_reencode(video_path, segments, output_path, run=run_ffmpeg):
+    audio = has_audio(video_path)
 
     # ffmpeg에서 사용할 filter_complex 생성
     filter_parts = []
-    idx = 0
+    concat_inputs = ""
 
-    for s, e in segments:
+    for idx, (s, e) in enumerate(segments):
         filter_parts.append(
             f"[0:v]trim=start={s}:end={e},setpts=PTS-STARTPTS[v{idx}];"
         )
-        idx += 1
+        concat_inputs += f"[v{idx}]"
 
-    concat_inputs = "".join(f"[v{i}]" for i in range(len(segments)))
+        if audio:
+            filter_parts.append(
+                f"[0:a]atrim=start={s}:end={e},asetpts=PTS-STARTPTS[a{idx}];"
+            )
+            concat_inputs += f"[a{idx}]"
 
     filter_complex = (
         "".join(filter_parts) +
-        f"{concat_inputs}concat=n={len(segments)}:v=1:a=0[out]"
+        f"{concat_inputs}concat=n={len(segments)}:v=1:a={1 if audio else 0}"
+        + ("[outv][outa]" if audio else "[outv]")
     )
 
-    # ffmpeg 실행
     cmd = [
         "ffmpeg", "-y",
         "-i", video_path,
         "-filter_complex", filter_complex,
-        "-map", "[out]",
-        local_output_path
+        "-map", "[outv]",
+    ]
+    if audio:
+        cmd += ["-map", "[outa]", "-c:a", "aac", "-b:a", "128k"]
+
+    cmd += [
+        "-c:v", "libx264",
+        "-preset", SHORTS_PRESET,
+        "-crf", SHORTS_CRF,
+        "-threads", SHORTS_THREADS,
+        *output_args(output_path),
     ]
 
-    subprocess.run(cmd, check=False)
+    return run(cmd)
 
-    # =========================================================
-    # S3 업로드
-    # =========================================================
-    s3_key = f"shorts/{local_out_name}"
 
-    s3_client.upload_file(
-        local_output_path,
-        S3_BUCKET,
-        s3_key,
-        ExtraArgs={"ContentType": "video/mp4"}
-    )
+# ============================================================
+# ❗ 최종 숏츠 생성 + S3 업로드
+# ============================================================
+def render_settings():
+    return {
+        "stream_copy": SHORTS_STREAM_COPY,
+        "tolerance": SHORTS_KEYFRAME_TOLERANCE,
+        "preset": SHORTS_PRESET,
+        "crf": SHORTS_CRF,
+        "fragmented": SHORTS_STREAM_UPLOAD,
+    }
 
-    # 업로드된 URL 반환
-    s3_url = f"https://{S3_BUCKET}.s3.{S3_REGION}.amazonaws.com/{s3_key}"
 
-    # 로컬 임시 파일 삭제
-    if os.path.exists(local_output_path):
-        os.remove(local_output_path)
+def compile_pet_shorts(video_path, segments, source_hash=None):
+    if not segments:
+        raise ValueError("반려동물 구간이 없습니다.")
 
-    return s3_url
+    # 같은 원본 + 같은 구간 + 같은 인코딩 설정 → 같은 S3 key
+    source_hash = source_hash or hash_file(video_path)
+    normalized = [[round(float(s), 3), round(float(e), 3)] for s, e in segments]
+    render_key = content_key(source_hash, normalized, render_settings())
+    s3_key = f"shorts/{render_key}.mp4"
+
+    url = shorts_index.get_url(render_key)
+    if url:
+        print(f"⚡ 이미 생성된 숏츠 재사용: {s3_key}")
+        return url
+
+    # 인덱스에 없어도 (다른 서버 / 인덱스 초기화) S3 에 이미 있으면 재사용
+    if object_exists(s3_key):
+        url = object_url(s3_key)
+        shorts_index.put_url(render_key, url)
+        return url
+
+    url = render_pet_shorts(video_path, segments, s3_key)
+    shorts_index.put_url(render_key, url)
+    return url
+
+
+def render_pet_shorts(video_path, segments, s3_key):
+    # 키프레임 근처에서 자를 수 있으면 재인코딩 없이 stream copy
+    snapped = None
+    if SHORTS_STREAM_COPY:
+        try:
+            snapped = snap_to_keyframes(segments, probe_keyframes(video_path))
+        except Exception as e:
+            print(f"⚠️ 키프레임 분석 실패 → 재인코딩: {e}")
+
+    if snapped:
+        print(f"⚡ stream copy 로 숏츠 생성 ({len(snapped)}개 구간)")
+        try:
+            return write_shorts(cut_stream_copy, video_path, snapped, s3_key)
+        except Exception as e:
+            # MP4 에 넣을 수 없는 코덱(webm Vorbis, mov PCM 등)이거나 concat 이 inpoint 를 거부한 경우
+            print(f"⚠️ stream copy 실패 → 재인코딩: {e}")
+            if SHORTS_STREAM_UPLOAD:
+                delete_object(s3_key)
+
+    print(f"🎬 재인코딩으로 숏츠 생성 ({len(segments)}개 구간, preset={SHORTS_PRESET})")
+    return write_shorts(cut_reencode, video_path, segments, s3_key)
+
+
+def write_shorts(cut, video_path, segments, s3_key):
+    # 인코딩하면서 바로 S3 로 업로드 (로컬 파일 없음)
+    if SHORTS_STREAM_UPLOAD:
+        return cut(video_path, segments, PIPE_OUTPUT,
+                   run=lambda cmd: upload_command_output(cmd, s3_key))
+
+    # 로컬 임시 파일 생성 후 업로드
+    # (S3 key 는 내용 기반이라 같은 영상을 동시에 렌더링할 수 있으므로 로컬 이름은 매번 새로)
+    local_output_path = os.path.join(tempfile.gettempdir(), f"pet_shorts_{uuid.uuid4().hex}.mp4")
+    try:
+        cut(video_path, segments, local_output_path)
+        return upload_file(local_output_path, s3_key)
+    finally:
+        if os.path.exists(local_output_path):
+            os.remove(local_output_path)
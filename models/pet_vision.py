@@ -0,0 +1,262 @@
+"""
+반려동물 라벨 탐지 공통 모듈 (pet_daily / pet_shorts 공용)
+batch_annotate_images 로 여러 프레임을 한 번에 요청
+"""
+
+import os
+import cv2
+from google.cloud import vision
+from utils.pipeline import bounded_map
+from utils.frame_sampler import sample_frames, get_video_info
+from utils.vision_cache import vision_cache
+
+PET_KEYWORDS = {"dog", "cat", "pet", "animal", "puppy", "kitten", "canidae"}
+PET_SCORE_THRESHOLD = 0.70
+
+# batch_annotate_images 1회 최대 이미지 수는 16
+VISION_BATCH_SIZE = min(int(os.getenv("VISION_BATCH_SIZE", "16")), 16)
+VISION_BATCH_CONCURRENCY = int(os.getenv("VISION_BATCH_CONCURRENCY", "4"))
+
+
+# ------------------------------------------------------
+# 라벨 → 반려동물 여부
+# labels: [(description, score), ...]
+# ------------------------------------------------------
+def has_pet_label(labels):
+    return any(desc.lower() in PET_KEYWORDS and score >= PET_SCORE_THRESHOLD
+               for desc, score in labels)
+
+
+# ------------------------------------------------------
+# 여러 이미지 → 한 번의 Vision 요청 (캐시에 없는 이미지만)
+# ------------------------------------------------------
+def annotate_labels(images_bytes, client):
+    keys = [vision_cache.make_key(content, "label") for content in images_bytes]
+    labels = [vision_cache.get(key) for key in keys]
+
+    missing = [i for i, cached in enumerate(labels) if cached is None]
+    if not missing:
+        return labels
+
+    requests = [
+        vision.AnnotateImageRequest(
+            image=vision.Image(content=images_bytes[i]),
+            features=[vision.Feature(type_=vision.Feature.Type.LABEL_DETECTION)]
+        )
+        for i in missing
+    ]
+
+    response = client.batch_annotate_images(requests=requests)
+
+    for i, res in zip(missing, response.responses):
+        if res.error.message:
+            raise RuntimeError(f"Vision API 오류: {res.error.message}")
+
+        labels[i] = [[label.description, label.score] for label in res.label_annotations]
+        vision_cache.put(keys[i], labels[i])
+
+    return labels
+
+
+def detect_pets_in_batch(images_bytes, client):
+    return [has_pet_label(labels) for labels in annotate_labels(images_bytes, client)]
+
+
+def detect_pet_in_frame(image_bytes, client):
+    return detect_pets_in_batch([image_bytes], client)[0]
+
+
+def iter_batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ------------------------------------------------------
+# 프레임 스트림 → (frame, has_pet) 순서대로 yield
+# ------------------------------------------------------
+def detect_pets_in_frames(frames, client, batch_size=None, concurrency=None):
+    """
+    frames: {"time_sec", "image_bytes"} 를 yield 하는 이터러블
+    batch_size 개씩 묶어 concurrency 개의 요청을 동시에 보낸다.
+    """
+    batch_size = batch_size or VISION_BATCH_SIZE
+    concurrency = concurrency or VISION_BATCH_CONCURRENCY
+
+    batches = iter_batches(frames, batch_size)
+
+    for batch, found in bounded_map(
+        lambda b: detect_pets_in_batch([f["image_bytes"] for f in b], client),
+        batches,
+        max_workers=concurrency,
+    ):
+        yield from zip(batch, found)
+
+
+# ======================================================
+# 적응형 샘플링: 성긴 1차 스캔 → 결과가 바뀌는 곳만 세밀하게
+# ======================================================
+PET_ADAPTIVE_SAMPLING = os.getenv("PET_ADAPTIVE_SAMPLING", "1") == "1"
+ADAPTIVE_COARSE_SEC = float(os.getenv("PET_COARSE_SEC", "2.0"))
+ADAPTIVE_FINE_SEC = float(os.getenv("PET_FINE_SEC", "0.25"))
+# 직전에 보낸 프레임과 히스토그램 거리(Bhattacharyya)가 이보다 작으면 같은 장면으로 보고 건너뜀
+SCENE_DIFF_THRESHOLD = float(os.getenv("PET_SCENE_DIFF_THRESHOLD", "0.08"))
+
+
+def frame_signature(frame):
+    small = cv2.resize(frame, (64, 36), interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, [16, 16], [0, 180, 0, 256])
+    return cv2.normalize(hist, hist)
+
+
+def encode_frame(time_sec, frame):
+    ok, buf = cv2.imencode(".jpg", frame)
+    return {"time_sec": time_sec, "image_bytes": buf.tobytes()} if ok else None
+
+
+def iter_frames(video_path, sec_per_frame=1.0):
+    """
+    디코딩 + JPEG 인코딩한 프레임을 하나씩 yield (전체를 메모리에 올리지 않음)
+    """
+    for time_sec, frame in sample_frames(video_path, sec_interval=sec_per_frame):
+        encoded = encode_frame(time_sec, frame)
+        if encoded:
+            yield encoded
+
+
+def _coarse_frames(video_path, sec_interval, duplicates):
+    """
+    일정 간격 프레임 중 직전 전송 프레임과 거의 같은 장면은 건너뛰고
+    duplicates 에 (시각, 대표 프레임 시각) 으로 기록
+    """
+    last_sig = None
+    last_time = None
+
+    for time_sec, frame in sample_frames(video_path, sec_interval=sec_interval):
+        sig = frame_signature(frame)
+
+        if last_sig is not None and \
+                cv2.compareHist(last_sig, sig, cv2.HISTCMP_BHATTACHARYYA) < SCENE_DIFF_THRESHOLD:
+            duplicates.append((time_sec, last_time))
+            continue
+
+        encoded = encode_frame(time_sec, frame)
+        if encoded:
+            last_sig, last_time = sig, time_sec
+            yield encoded
+
+
+def _detect_at(video_path, timestamps, client):
+    frames = (encode_frame(t, f) for t, f in sample_frames(video_path, timestamps=timestamps))
+    return {frame["time_sec"]: found
+            for frame, found in detect_pets_in_frames((f for f in frames if f), client)}
+
+
+def adaptive_pet_scan(video_path, client, coarse_sec=None, fine_sec=None):
+    """
+    반환: [(time_sec, has_pet), ...] 시각 순
+    1) coarse_sec 간격 스캔 (같은 장면 연속 프레임은 Vision 호출 생략)
+    2) 이웃 샘플의 결과가 다른 구간만 중간 지점을 반복 샘플링 (간격 fine_sec 까지)
+    """
+    coarse_sec = coarse_sec or ADAPTIVE_COARSE_SEC
+    fine_sec = fine_sec or ADAPTIVE_FINE_SEC
+
+    duplicates = []
+    results = {frame["time_sec"]: found
+               for frame, found in detect_pets_in_frames(
+                   _coarse_frames(video_path, coarse_sec, duplicates), client)}
+
+    for time_sec, ref_time in duplicates:
+        results[time_sec] = results.get(ref_time, False)
+
+    sent = len(results) - len(duplicates)
+
+    while True:
+        times = sorted(results)
+        mids = [
+            (a + b) / 2
+            for a, b in zip(times, times[1:])
+            if results[a] != results[b] and b - a > fine_sec
+        ]
+        if not mids:
+            break
+
+        # 중간 지점이 기존 샘플과 같은 프레임으로 반올림되면 더 나눌 수 없음
+        refined = {t: found for t, found in _detect_at(video_path, mids, client).items()
+                   if t not in results}
+        if not refined:
+            break
+        results.update(refined)
+        sent += len(refined)
+
+    print(f"⚡ 적응형 샘플링: 샘플 {len(results)}개 중 Vision 호출 {sent}개")
+    return sorted(results.items())
+
+
+# ======================================================
+# 조기 종료: 반려동물이 한 번이라도 보이면 바로 중단 (/pet_daily 용)
+# ======================================================
+EARLY_EXIT_MIN_GAP_SEC = float(os.getenv("PET_EARLY_EXIT_MIN_GAP_SEC", "1.0"))
+
+
+def coarse_to_fine_levels(duration, min_gap=EARLY_EXIT_MIN_GAP_SEC, last_sec=None):
+    """
+    가운데 → 처음/끝 → 1/4, 3/4 → 1/8, 3/8, ... 순서의 시각 목록을 단계별로 yield
+    짧은 영상도 가운데와 처음/끝(last_sec)은 항상 확인하고,
+    그 뒤 단계는 간격이 min_gap 보다 좁아지면 종료
+    """
+    last_sec = duration if last_sec is None else last_sec
+
+    yield [duration / 2]
+    yield [0.0, last_sec]
+
+    level = 2
+    while True:
+        step = duration / 2 ** level
+        if step < min_gap:
+            break
+        yield [k * step for k in range(1, 2 ** level, 2)]
+        level += 1
+
+
+def find_first_pet(video_path, client, min_gap=EARLY_EXIT_MIN_GAP_SEC):
+    """
+    반려동물이 보이는 첫 시각 (없으면 None)
+    단계마다 필요한 프레임만 seek 해서 보내고, 찾는 즉시 디코딩과 남은 요청을 중단
+    """
+    info = get_video_info(video_path)
+    duration = info["duration"]
+
+    if duration > 0:
+        last_sec = (info["frame_count"] - 1) / info["fps"]
+        rounds = (sample_frames(video_path, timestamps=times)
+                  for times in coarse_to_fine_levels(duration, min_gap, last_sec))
+    else:
+        # 길이를 모르는 영상(webm 등)은 처음부터 순서대로
+        rounds = [sample_frames(video_path, sec_interval=min_gap)]
+
+    checked = 0
+
+    for raw in rounds:
+        frames = (f for f in (encode_frame(t, frame) for t, frame in raw) if f)
+        results = detect_pets_in_frames(frames, client)
+
+        try:
+            for frame, found in results:
+                checked += 1
+                if found:
+                    print(f"⚡ 조기 종료: {checked}번째 프레임에서 반려동물 확인 ({frame['time_sec']:.2f}s)")
+                    return frame["time_sec"]
+        finally:
+            # 남은 Vision 요청 취소 + 디코더 해제
+            results.close()
+            raw.close()
+
+    print(f"⚡ 조기 종료 모드: {checked}개 프레임 확인, 반려동물 없음")
+    return None
@@ -9,13 +9,24 @@ os.environ["MEDIAPIPE_DISABLE_GPU"] = "1"     # Mediapipe GPU 금지
 
 import cv2
 import base64
+import re
 import json
+import math
+import time
+import heapq
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import numpy as np
-from pydub import AudioSegment
-from pydub.effects import speedup
+import subprocess
 from google.cloud import vision
-import google.generativeai as genai
 import mediapipe as mp
+from utils.frame_sampler import sample_frames, get_video_info
+from utils.clients import get_vision_client, get_gemini_model
+from utils.vision_cache import vision_cache
+from utils.detector_pool import DetectorPool
+from utils.pipeline import bounded_map
 
 
 
@@ -26,15 +37,22 @@ import mediapipe as mp
 
 mp_face_mesh = mp.solutions.face_mesh
 
-mesh_detector = mp_face_mesh.FaceMesh(
-    max_num_faces=5,
-    refine_landmarks=False,
-    min_detection_confidence=0.5,
-    min_tracking_confidence=0.5,
-    static_image_mode=False
-)
+# 썸네일 요청끼리 병렬 처리 → 프레임 단위 독립 검출 (static_image_mode=True)
+FACEMESH_POOL_SIZE = int(os.getenv("FACEMESH_POOL_SIZE", str(os.cpu_count() or 1)))
 
 
+def create_mesh_detector():
+    return mp_face_mesh.FaceMesh(
+        max_num_faces=5,
+        refine_landmarks=False,
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5,
+        static_image_mode=True
+    )
+
+
+mesh_pool = DetectorPool(create_mesh_detector, FACEMESH_POOL_SIZE)
+
 
 UPPER_LIP = 13
 LOWER_LIP = 14
@@ -42,33 +60,6 @@ LEFT_MOUTH = 61
 RIGHT_MOUTH = 291
 
 
-def is_smile_candidate(frame):
-    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    result = mesh_detector.process(rgb)
-
-    if not result.multi_face_landmarks:
-        return False
-
-    lm = result.multi_face_landmarks[0].landmark
-    h, w, _ = frame.shape
-
-    def pos(idx):
-        return np.array([lm[idx].x * w, lm[idx].y * h])
-
-    upper = pos(UPPER_LIP)
-    lower = pos(LOWER_LIP)
-    left = pos(LEFT_MOUTH)
-    right = pos(RIGHT_MOUTH)
-
-    lip_distance = np.linalg.norm(upper - lower)
-    center = (upper + lower) / 2
-    curvature = (center[1] - left[1]) + (center[1] - right[1])
-
-    smile_score = curvature * 0.6 + lip_distance * 0.4
-
-    return smile_score > 6
-
-
 # ============================================================
 # 2. Vision API Batch 분석
 # ============================================================
@@ -82,47 +73,65 @@ LIKELIHOOD_SCORE = {
 }
 
 
-def analyze_batch(frames):
-    MAX_BATCH = 16
-    all_results = []
+def face_score(faces):
+    total_score = 0
+    for face in faces:
+        blur_val = LIKELIHOOD_SCORE.get(face["blurred"], 0)
+        under_val = LIKELIHOOD_SCORE.get(face["under_exposed"], 0)
+        joy_val = LIKELIHOOD_SCORE.get(face["joy"], 0)
 
-    for i in range(0, len(frames), MAX_BATCH):
-        chunk = frames[i:i + MAX_BATCH]
+        base = 0
+        if blur_val < 3: base += 40
+        if under_val < 3: base += 20
+        if abs(face["roll"]) < 20 and abs(face["pan"]) < 20:
+            base += 20
 
-        requests = [
-            vision.AnnotateImageRequest(
-                image=vision.Image(content=f["image_bytes"]),
-                features=[vision.Feature(type_=vision.Feature.Type.FACE_DETECTION)]
-            )
-            for f in chunk
-        ]
+        joy_score = joy_val / 5.0 * 300
+        total_score += base + joy_score
 
-        response = vision_client.batch_annotate_images(requests=requests)
+    return total_score
 
-        for frame, res in zip(chunk, response.responses):
-            faces = res.face_annotations
 
-            if not faces:
-                frame["score"] = 0
-                all_results.append(frame)
-                continue
-
-            total_score = 0
-            for face in faces:
-                blur_val = LIKELIHOOD_SCORE.get(face.blurred_likelihood.name, 0)
-                under_val = LIKELIHOOD_SCORE.get(face.under_exposed_likelihood.name, 0)
-                joy_val = LIKELIHOOD_SCORE.get(face.joy_likelihood.name, 0)
+def analyze_batch(frames):
+    MAX_BATCH = 16
+    all_results = []
+    vision_client = get_vision_client()
 
-                base = 0
-                if blur_val < 3: base += 40
-                if under_val < 3: base += 20
-                if abs(face.roll_angle) < 20 and abs(face.pan_angle) < 20:
-                    base += 20
+    for i in range(0, len(frames), MAX_BATCH):
+        chunk = frames[i:i + MAX_BATCH]
 
-                joy_score = joy_val / 5.0 * 300
-                total_score += base + joy_score
+        # 같은 프레임(재업로드)은 캐시된 얼굴 정보 사용
+        keys = [vision_cache.make_key(f["image_bytes"], "face") for f in chunk]
+        faces_list = [vision_cache.get(key) for key in keys]
+        missing = [j for j, faces in enumerate(faces_list) if faces is None]
+
+        if missing:
+            requests = [
+                vision.AnnotateImageRequest(
+                    image=vision.Image(content=chunk[j]["image_bytes"]),
+                    features=[vision.Feature(type_=vision.Feature.Type.FACE_DETECTION)]
+                )
+                for j in missing
+            ]
 
-            frame["score"] = total_score
+            response = vision_client.batch_annotate_images(requests=requests)
+
+            for j, res in zip(missing, response.responses):
+                faces_list[j] = [
+                    {
+                        "blurred": face.blurred_likelihood.name,
+                        "under_exposed": face.under_exposed_likelihood.name,
+                        "joy": face.joy_likelihood.name,
+                        "roll": face.roll_angle,
+                        "pan": face.pan_angle,
+                    }
+                    for face in res.face_annotations
+                ]
+                if not res.error.message:
+                    vision_cache.put(keys[j], faces_list[j])
+
+        for frame, faces in zip(chunk, faces_list):
+            frame["score"] = face_score(faces) if faces else 0
             all_results.append(frame)
 
     return all_results
@@ -130,34 +139,136 @@ def analyze_batch(frames):
 
 
 # ============================================================
-# 0. Blur 체크 함수 (흔들린 프레임 완전 제거)
+# 0. 1단계: 축소 영상으로 흔들림 / 노출 체크
 # ============================================================
-def is_blurry(frame, threshold=80):
+# 단계별 기준값 (환경변수로 조정)
+QUALITY_CHECK_WIDTH = int(os.getenv("THUMB_QUALITY_WIDTH", "320"))
+# 원본 해상도 기준 Laplacian 분산 (축소 영상에서는 축소 비율에 맞춰 환산)
+BLUR_THRESHOLD = float(os.getenv("THUMB_BLUR_THRESHOLD", "80"))
+MIN_BRIGHTNESS = float(os.getenv("THUMB_MIN_BRIGHTNESS", "40"))
+MAX_BRIGHTNESS = float(os.getenv("THUMB_MAX_BRIGHTNESS", "220"))
+FACE_GATE = os.getenv("THUMB_FACE_GATE", "1") == "1"
+FACE_CROP_MARGIN = float(os.getenv("THUMB_FACE_CROP_MARGIN", "0.3"))
+
+
+def is_blurry(frame, threshold=BLUR_THRESHOLD):
     """
     Laplacian variance 기반 흔들림 감지
     threshold ↑ : 더 엄격 (80~120 권장)
     """
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
     val = cv2.Laplacian(gray, cv2.CV_64F).var()
     return val < threshold
 
 
+def passes_quality(frame):
+    h, w = frame.shape[:2]
+    threshold = BLUR_THRESHOLD
+
+    if w > QUALITY_CHECK_WIDTH:
+        frame = cv2.resize(frame, (QUALITY_CHECK_WIDTH, int(h * QUALITY_CHECK_WIDTH / w)),
+                           interpolation=cv2.INTER_AREA)
+        # 축소하면 흐림 반경도 같이 줄어 분산이 대략 (축소 비율)^2 배로 커짐
+        threshold *= (w / QUALITY_CHECK_WIDTH) ** 2
+
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    if not MIN_BRIGHTNESS <= gray.mean() <= MAX_BRIGHTNESS:
+        return False
+    return not is_blurry(gray, threshold)
+
+
 # ============================================================
-# 1. 웃는 얼굴 후보 + Blur 제거
+# 0-1. 2단계: 빠른 얼굴 검출 → 얼굴 영역만 FaceMesh 로
 # ============================================================
-def is_smile_candidate(frame):
-    # 🔥 1) Blur 먼저 검사
-    if is_blurry(frame):
-        return False
+mp_face_detection = mp.solutions.face_detection
+
+
+def create_face_detector():
+    # model_selection=1 : 카메라에서 먼 얼굴(최대 5m)까지
+    return mp_face_detection.FaceDetection(model_selection=1, min_detection_confidence=0.5)
+
+
+face_det_pool = DetectorPool(create_face_detector, FACEMESH_POOL_SIZE)
+
+
+def find_face_crop(frame, rgb):
+    """
+    가장 큰 얼굴 주변 영역 (x0, y0, x1, y1) 픽셀 좌표, 얼굴이 없으면 None
+    """
+    with face_det_pool.acquire() as detector:
+        result = detector.process(rgb)
+
+    if not result.detections:
+        return None
+
+    h, w = frame.shape[:2]
+    box = max(
+        (d.location_data.relative_bounding_box for d in result.detections),
+        key=lambda b: b.width * b.height,
+    )
+
+    mx, my = box.width * FACE_CROP_MARGIN, box.height * FACE_CROP_MARGIN
+    x0 = int(max(box.xmin - mx, 0) * w)
+    y0 = int(max(box.ymin - my, 0) * h)
+    x1 = int(min(box.xmin + box.width + mx, 1) * w)
+    y1 = int(min(box.ymin + box.height + my, 1) * h)
+
+    if x1 - x0 < 2 or y1 - y0 < 2:
+        return None
+    return x0, y0, x1, y1
+
+
+# ============================================================
+# 1. 3단계: 웃는 얼굴 점수 (FaceMesh)
+# ============================================================
+SMILE_THRESHOLD = 8   # 기존 6 → 8 (웃는 얼굴만 남김)
+
+
+def new_cascade_stats():
+    return {
+        "sampled": 0,
+        "rejected_quality": 0,    # 1단계: 흔들림 / 노출
+        "rejected_no_face": 0,    # 2단계: 얼굴 검출 실패
+        "rejected_no_mesh": 0,    # 3단계: FaceMesh 실패
+        "rejected_smile": 0,      # 웃음 점수 미달
+        "passed": 0,
+    }
+
+
+def smile_score(frame, stats=None):
+    """
+    웃음 점수 (흔들렸거나 얼굴이 없으면 None)
+    싼 검사부터 순서대로 → 대부분의 (얼굴 없는) 프레임은 FaceMesh 까지 가지 않음
+    """
+    stats = stats if stats is not None else new_cascade_stats()
+    stats["sampled"] += 1
+
+    # 🔥 1) 축소 영상으로 blur / 노출 먼저 검사
+    if not passes_quality(frame):
+        stats["rejected_quality"] += 1
+        return None
 
     rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    result = mesh_detector.process(rgb)
+
+    # 🔥 2) 빠른 얼굴 검출 → 얼굴 영역만 잘라서 FaceMesh
+    if FACE_GATE:
+        crop = find_face_crop(frame, rgb)
+        if crop is None:
+            stats["rejected_no_face"] += 1
+            return None
+        x0, y0, x1, y1 = crop
+        rgb = np.ascontiguousarray(rgb[y0:y1, x0:x1])
+
+    with mesh_pool.acquire() as detector:
+        result = detector.process(rgb)
 
     if not result.multi_face_landmarks:
-        return False
+        stats["rejected_no_mesh"] += 1
+        return None
 
+    # 잘라낸 영역 기준 픽셀 좌표 (원본과 같은 스케일)
     lm = result.multi_face_landmarks[0].landmark
-    h, w, _ = frame.shape
+    h, w, _ = rgb.shape
 
     def pos(idx):
         return np.array([lm[idx].x * w, lm[idx].y * h])
@@ -171,43 +282,169 @@ def is_smile_candidate(frame):
     center = (upper + lower) / 2
     curvature = (center[1] - left[1]) + (center[1] - right[1])
 
-    smile_score = curvature * 0.6 + lip_distance * 0.4
+    score = curvature * 0.6 + lip_distance * 0.4
+
+    if score > SMILE_THRESHOLD:
+        stats["passed"] += 1
+    else:
+        stats["rejected_smile"] += 1
+    return score
+
 
-    # 🔥 2) 웃음 점수 threshold 약간 상향
-    return smile_score > 8   # 기존 6 → 8 (웃는 얼굴만 남김)
 # ============================================================
-# 3. 웃는 얼굴 후보 프레임 추출
+# 3. 웃는 얼굴 후보 선택 (영상 전체에 고르게, 최대 top_k 개)
 # ============================================================
+THUMBNAIL_TOP_K = int(os.getenv("THUMBNAIL_TOP_K", "12"))
+
+
+class CandidateSelector:
+    """
+    영상을 top_k 개 시간 구간으로 나눠 구간마다 웃음 점수 최고 프레임 1개만 보관.
+    길이를 모르면 전체에서 점수 상위 top_k 개를 heap 으로 보관.
+    → 메모리는 top_k 프레임으로 고정, 앞부분 몇 초에 치우치지 않음
+    """
+
+    def __init__(self, duration, top_k=THUMBNAIL_TOP_K, start_sec=0.0):
+        self.top_k = top_k
+        self.start_sec = start_sec
+        self.bucket_sec = duration / top_k if duration > 0 else None
+        self._best = {}    # 구간 번호 → (score, time_sec, payload)
+        self._heap = []
+
+    def offer(self, time_sec, score, payload):
+        item = (score, time_sec, payload)
+
+        if self.bucket_sec is None:
+            if len(self._heap) < self.top_k:
+                heapq.heappush(self._heap, item)
+            elif score > self._heap[0][0]:
+                heapq.heapreplace(self._heap, item)
+            return
+
+        bucket = min(int((time_sec - self.start_sec) / self.bucket_sec), self.top_k - 1)
+        current = self._best.get(bucket)
+        if current is None or score > current[0]:
+            self._best[bucket] = item
+
+    def results(self):
+        items = self._heap if self.bucket_sec is None else self._best.values()
+        return sorted(items, key=lambda x: x[1])
+
+
+def scan_range(video_path, start_sec=0.0, end_sec=None, sec_interval=0.35, top_k=THUMBNAIL_TOP_K):
+    """
+    start_sec ~ end_sec 구간을 훑어서 구간 내 후보(JPEG)와 단계별 통계 반환
+    (병렬 스캔 시 프로세스마다 이 함수를 실행)
+    """
+    if end_sec is None:
+        duration = get_video_info(video_path)["duration"] - start_sec
+    else:
+        duration = end_sec - start_sec
+
+    selector = CandidateSelector(duration, top_k, start_sec)
+    stats = new_cascade_stats()
 
-def extract_candidate_frames(video_path, sec_interval=0.35):
-    cap = cv2.VideoCapture(video_path)
-    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
-    step = max(int(fps * sec_interval), 1)
+    for time_sec, frame in sample_frames(video_path, sec_interval=sec_interval,
+                                         start_sec=start_sec, end_sec=end_sec):
+        score = smile_score(frame, stats)
+        if score is not None and score > SMILE_THRESHOLD:
+            selector.offer(time_sec, score, frame)
 
+    # 살아남은 후보만 JPEG 인코딩 (1회)
     frames = []
-    frame_idx = 0
-    total = 0
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        total += 1
-
-        if frame_idx % step == 0:
-            if is_smile_candidate(frame):
-                ok, buffer = cv2.imencode(".jpg", frame)
-                if ok:
-                    frames.append({
-                        "time_sec": frame_idx / fps,
-                        "image_cv2": frame,
-                        "image_bytes": buffer.tobytes(),
-                    })
-
-        frame_idx += 1
-
-    cap.release()
-    print(f"⚡ 전체 {total}프레임 → 후보 {len(frames)}개")
+    for score, time_sec, frame in selector.results():
+        ok, buffer = cv2.imencode(".jpg", frame)
+        if ok:
+            frames.append({
+                "time_sec": time_sec,
+                "smile_score": score,
+                "image_bytes": buffer.tobytes(),
+            })
+
+    return frames, stats
+
+
+# ============================================================
+# 3-1. 시간 구간별 병렬 스캔 (프로세스마다 자체 검출기)
+# ============================================================
+THUMBNAIL_SCAN_PROCS = int(os.getenv("THUMBNAIL_SCAN_PROCS", "1"))
+THUMBNAIL_PARALLEL_MIN_SEC = float(os.getenv("THUMBNAIL_PARALLEL_MIN_SEC", "60"))
+
+_scan_executor = None
+_scan_executor_size = 0
+_scan_executor_lock = threading.Lock()
+
+
+def get_scan_executor(processes):
+    """
+    스캔용 프로세스 풀 (요청마다 새로 띄우지 않도록 재사용)
+    MediaPipe 그래프를 fork 로 복사하지 않도록 spawn 사용
+    프로세스가 죽어 풀이 깨졌거나 요청한 크기가 다르면 새로 만든다.
+    """
+    global _scan_executor, _scan_executor_size
+    with _scan_executor_lock:
+        exe = _scan_executor
+        if exe is not None and (exe._broken or _scan_executor_size != processes):
+            # 실행 중인 다른 요청의 작업은 끝까지 진행됨
+            exe.shutdown(wait=False)
+            exe = None
+
+        if exe is None:
+            exe = ProcessPoolExecutor(
+                max_workers=processes, mp_context=multiprocessing.get_context("spawn")
+            )
+            _scan_executor, _scan_executor_size = exe, processes
+
+        return exe
+
+
+def discard_scan_executor(exe):
+    global _scan_executor
+    with _scan_executor_lock:
+        if _scan_executor is exe:
+            _scan_executor = None
+    exe.shutdown(wait=False)
+
+
+def extract_candidate_frames(video_path, sec_interval=0.35, top_k=THUMBNAIL_TOP_K, processes=None):
+    processes = processes or THUMBNAIL_SCAN_PROCS
+    duration = get_video_info(video_path)["duration"]
+
+    if processes <= 1 or duration < THUMBNAIL_PARALLEL_MIN_SEC:
+        frames, stats = scan_range(video_path, 0.0, None, sec_interval, top_k)
+        print(f"⚡ 단계별 결과 {stats} → 후보 {len(frames)}개")
+        return frames
+
+    # 구간 경계를 샘플 간격 배수로 맞춰서 나눔
+    step = math.ceil(duration / processes / sec_interval) * sec_interval
+    bounds = [(i * step, min((i + 1) * step, duration)) for i in range(processes) if i * step < duration]
+
+    exe = get_scan_executor(processes)
+    futures = [
+        exe.submit(scan_range, video_path, start, end, sec_interval, top_k)
+        for start, end in bounds
+    ]
+
+    # 구간별 후보를 모아 영상 전체 기준으로 다시 top_k 선택
+    selector = CandidateSelector(duration, top_k)
+    stats = new_cascade_stats()
+
+    try:
+        parts = [future.result() for future in futures]
+    except BrokenProcessPool as e:
+        # 스캔 프로세스가 죽음(MediaPipe crash, OOM 등) → 풀을 버리고 이번 요청은 단일 스캔
+        print(f"⚠️ 병렬 스캔 프로세스 종료 → 단일 스캔으로 재시도: {e}", flush=True)
+        discard_scan_executor(exe)
+        return extract_candidate_frames(video_path, sec_interval, top_k, processes=1)
+
+    for part_frames, part_stats in parts:
+        for f in part_frames:
+            selector.offer(f["time_sec"], f["smile_score"], f)
+        for key, value in part_stats.items():
+            stats[key] += value
+
+    frames = [f for _, _, f in selector.results()]
+    print(f"⚡ {len(bounds)}개 구간 병렬 스캔, 단계별 결과 {stats} → 후보 {len(frames)}개")
     return frames
 
 
@@ -220,15 +457,12 @@ def find_best_thumbnail(video_path):
     if len(candidates) == 0:
         return None
 
-    if len(candidates) > 12:
-        candidates = candidates[:12]
-
     scored = analyze_batch(candidates)
     scored.sort(key=lambda x: x["score"], reverse=True)
 
+    # Vision 에 보낸 JPEG 그대로 사용 (재인코딩 없음)
     best = scored[0]
-    ok, buffer = cv2.imencode(".jpg", best["image_cv2"])
-    img_base64 = base64.b64encode(buffer).decode("utf-8")
+    img_base64 = base64.b64encode(best["image_bytes"]).decode("utf-8")
 
     print(f"🎉 최종 썸네일 (score={best['score']:.1f}, time={best['time_sec']:.2f}s)")
 
@@ -242,68 +476,254 @@ def find_best_thumbnail(video_path):
 # ============================================================
 # 5. 오디오 추출 → 1.2x → Gemini (무음 제거 없음)
 # ============================================================
-# ============================================================
-# 5. 오디오 추출 → 1.2x → Gemini (무음 제거 없음)
-# ============================================================
-from pydub import AudioSegment
-from pydub.effects import speedup
-
-def extract_audio(video_path, audio_path=None):
-    try:
-        # 🔥 audio_path를 명시하지 않으면, 원본 경로 기반으로 자동 부여
-        if audio_path is None:
-            audio_path = f"{video_path}.audio.mp3"
+# ffmpeg 가 디코딩 + atempo + 저비트레이트 mono Opus 인코딩을 한 번에 처리 → 메모리로 바로 받음
+STT_AUDIO_TEMPO = float(os.getenv("STT_AUDIO_TEMPO", "1.2"))
+STT_AUDIO_BITRATE = os.getenv("STT_AUDIO_BITRATE", "24k")
+STT_AUDIO_MIME = "audio/ogg"
+# Gemini inline 요청 한도(20MB) 안쪽으로 제한
+STT_AUDIO_MAX_BYTES = int(os.getenv("STT_AUDIO_MAX_BYTES", str(18 * 1024 * 1024)))
 
-        # 🔥 format 인자 제거 → ffmpeg가 컨테이너(webm/mp4) 자동 인식
-        audio = AudioSegment.from_file(video_path)
 
-        # 필요하면 무음 제거 다시 붙일 수 있음
-        # audio = remove_silence(audio)
+def extract_audio(video_path, start_sec=None, end_sec=None):
+    """
+    영상 → 1.2x 속도 mono Opus(ogg) bytes (임시 파일 없음)
+    start_sec / end_sec 를 주면 원본 기준 해당 구간만 추출
+    """
+    cmd = ["ffmpeg", "-v", "error"]
+    if start_sec:
+        cmd += ["-ss", f"{start_sec:.3f}"]
+    if end_sec is not None:
+        cmd += ["-t", f"{end_sec - (start_sec or 0.0):.3f}"]
+
+    cmd += [
+        "-i", video_path,
+        "-vn", "-ac", "1", "-ar", "16000",
+        "-filter:a", f"atempo={STT_AUDIO_TEMPO}",
+        "-c:a", "libopus", "-b:a", STT_AUDIO_BITRATE, "-application", "voip",
+        "-f", "ogg", "pipe:1",
+    ]
+
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    chunks = []
+    size = 0
 
-        # 1.2x 속도 증가
-        audio = speedup(audio, playback_speed=1.2, chunk_size=60, crossfade=40)
+    try:
+        for chunk in iter(lambda: proc.stdout.read(64 * 1024), b""):
+            size += len(chunk)
+            if size > STT_AUDIO_MAX_BYTES:
+                proc.kill()
+                raise RuntimeError(f"오디오가 너무 깁니다 ({STT_AUDIO_MAX_BYTES} bytes 초과)")
+            chunks.append(chunk)
 
-        audio.export(audio_path, format="mp3")
-        return audio_path
+        stderr = proc.stderr.read()
+        if proc.wait() != 0:
+            raise RuntimeError(stderr.decode(errors="ignore")[-500:])
 
     except Exception as e:
         raise RuntimeError(f"Audio extraction failed: {e}")
 
+    finally:
+        proc.stdout.close()
+        proc.stderr.close()
+        proc.wait()
 
-def analyze_video_content(video_path, api_key):
-    if not api_key:
-        raise ValueError("유효한 Google API Key 필요")
+    return b"".join(chunks)
+
+
+# ============================================================
+# 6. 긴 오디오: 무음 지점에서 분할 → 구간별 요약(병렬) → 최종 요약/제목
+# ============================================================
+STT_CHUNK_MIN_SEC = float(os.getenv("STT_CHUNK_MIN_SEC", "300"))     # 이보다 긴 영상만 분할
+STT_CHUNK_MAX_SEC = float(os.getenv("STT_CHUNK_MAX_SEC", "180"))     # 구간 최대 길이 (원본 기준)
+STT_CHUNK_CONCURRENCY = int(os.getenv("STT_CHUNK_CONCURRENCY", "4"))
+STT_CHUNK_RETRIES = int(os.getenv("STT_CHUNK_RETRIES", "2"))
+STT_RETRY_BACKOFF_SEC = float(os.getenv("STT_RETRY_BACKOFF_SEC", "1.0"))
+STT_SILENCE_DB = os.getenv("STT_SILENCE_DB", "-35dB")
+STT_SILENCE_MIN_SEC = float(os.getenv("STT_SILENCE_MIN_SEC", "0.5"))
+
+SUMMARY_PROMPT = """
+이 오디오 내용을 한국어로 한 문장 요약하되,주변 소음보다 발화 내용을 우선으로 내용을 요약하세요.
+영상의 주제를 반영한 간결한 제목을 생성하세요. 
+반드시 JSON 형식으로:
+{
+  "summary": "...",
+  "title": "..."
+}
+"""
+
+CHUNK_PROMPT = """
+이 오디오는 긴 영상의 {index}/{total} 번째 구간입니다.
+주변 소음보다 발화 내용을 우선으로, 이 구간의 내용을 한국어 2~3문장으로 요약하세요.
+요약 문장만 출력하세요.
+"""
 
-    genai.configure(api_key=api_key)
+REDUCE_PROMPT = """
+아래는 한 영상을 시간 순서대로 나눈 구간별 요약입니다.
 
-    audio_file_path = extract_audio(video_path)
+{summaries}
 
+전체 내용을 한국어로 한 문장 요약하고, 영상의 주제를 반영한 간결한 제목을 생성하세요.
+반드시 JSON 형식으로:
+{{
+  "summary": "...",
+  "title": "..."
+}}
+"""
+
+
+def parse_json_response(text):
+    clean = text.strip().lstrip("```json").rstrip("```").strip()
+    return json.loads(clean)
+
+
+def generate_with_retry(model, contents, retries=STT_CHUNK_RETRIES, parse=None):
+    """
+    generate_content 실패(또는 parse 실패) 시 retries 번까지 지수 백오프로 재시도
+    """
+    for attempt in range(retries + 1):
+        try:
+            text = model.generate_content(contents).text
+            return parse(text) if parse else text.strip()
+        except Exception as e:
+            if attempt == retries:
+                raise
+            wait = STT_RETRY_BACKOFF_SEC * 2 ** attempt
+            print(f"⚠️ Gemini 요청 실패 ({attempt + 1}/{retries + 1}), {wait:.1f}s 후 재시도: {e}", flush=True)
+            time.sleep(wait)
+
+
+def probe_duration(video_path):
+    """
+    컨테이너 길이(초). MediaRecorder webm 처럼 길이 정보가 없으면 None
+    (OpenCV 프레임 수는 webm / 오디오 전용 파일에서 0 이므로 ffprobe 사용)
+    """
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "csv=p=0",
+        video_path,
+    ]
+    out = subprocess.run(cmd, capture_output=True).stdout.decode(errors="ignore").strip()
     try:
-        with open(audio_file_path, "rb") as f:
-            audio_bytes = f.read()
+        duration = float(out)
+    except ValueError:
+        return None
+    return duration if duration > 0 else None
 
-        model = genai.GenerativeModel("gemini-2.5-flash")
 
+def find_silences(video_path):
+    """
+    ffmpeg silencedetect 로 무음 구간의 가운데 시각 목록 (원본 기준)
+    반환: (무음 시각 목록, 끝까지 디코딩한 길이)
+    """
+    cmd = [
+        "ffmpeg", "-hide_banner", "-stats",
+        "-i", video_path,
+        "-vn", "-ac", "1",
+        "-af", f"silencedetect=noise={STT_SILENCE_DB}:d={STT_SILENCE_MIN_SEC}",
+        "-f", "null", "-",
+    ]
+    log = subprocess.run(cmd, capture_output=True).stderr.decode(errors="ignore")
+
+    starts = [float(v) for v in re.findall(r"silence_start: (-?[\d.]+)", log)]
+    ends = [float(v) for v in re.findall(r"silence_end: ([\d.]+)", log)]
+    silences = [(max(a, 0.0) + b) / 2 for a, b in zip(starts, ends)]
+
+    # 마지막 진행 표시(time=HH:MM:SS.xx) = 실제 오디오 길이
+    progress = re.findall(r"time=(\d+):(\d+):([\d.]+)", log)
+    decoded = 0.0
+    if progress:
+        h, m, sec = progress[-1]
+        decoded = int(h) * 3600 + int(m) * 60 + float(sec)
+
+    return silences, decoded
+
+
+def plan_chunks(duration, silences, max_sec=STT_CHUNK_MAX_SEC):
+    """
+    [(start, end), ...] - 각 구간은 max_sec 이하
+    구간 뒤쪽 절반 안에 있는 마지막 무음 지점에서 자르고, 없으면 max_sec 에서 자름
+    """
+    chunks = []
+    start = 0.0
 
-        prompt = """
-        이 오디오 내용을 한국어로 한 문장 요약하되,주변 소음보다 발화 내용을 우선으로 내용을 요약하세요.
-        영상의 주제를 반영한 간결한 제목을 생성하세요. 
-        반드시 JSON 형식으로:
-        {
-          "summary": "...",
-          "title": "..."
-        }
-        """
+    while duration - start > max_sec:
+        limit = start + max_sec
+        cuts = [t for t in silences if start + max_sec / 2 <= t <= limit]
+        end = cuts[-1] if cuts else limit
+        chunks.append((start, end))
+        start = end
 
-        response = model.generate_content(
-            [
-                {"mime_type": "audio/mpeg", "data": audio_bytes},
-                prompt
-            ]
-        )
+    chunks.append((start, duration))
+    return chunks
 
-        clean = response.text.strip().lstrip("```json").rstrip("```").strip()
-        result = json.loads(clean)
+
+def analyze_single(video_path, model):
+    audio_bytes = extract_audio(video_path)
+    return generate_with_retry(
+        model,
+        [{"mime_type": STT_AUDIO_MIME, "data": audio_bytes}, SUMMARY_PROMPT],
+        parse=parse_json_response,
+    )
+
+
+def analyze_long_audio(video_path, model, duration=None):
+    """
+    duration 을 모르면 silencedetect 로 끝까지 디코딩한 길이를 사용
+    """
+    silences, decoded = find_silences(video_path)
+    duration = duration or decoded
+
+    if duration <= STT_CHUNK_MIN_SEC:
+        return analyze_single(video_path, model)
+
+    chunks = plan_chunks(duration, silences)
+    total = len(chunks)
+    print(f"🎧 긴 오디오 {duration:.0f}s → {total}개 구간으로 분할", flush=True)
+
+    def summarize(indexed):
+        index, (start, end) = indexed
+        try:
+            # 마지막 구간은 길이 추정이 어긋나도 잘리지 않도록 끝까지
+            audio_bytes = extract_audio(video_path, start, end if index < total else None)
+            return generate_with_retry(model, [
+                {"mime_type": STT_AUDIO_MIME, "data": audio_bytes},
+                CHUNK_PROMPT.format(index=index, total=total),
+            ])
+        except Exception as e:
+            # 한 구간이 끝내 실패해도 나머지 구간으로 요약을 만든다
+            print(f"⚠️ 구간 {index}/{total} ({start:.0f}~{end:.0f}s) 요약 실패: {e}", flush=True)
+            return None
+
+    summaries = [
+        f"[{index}] {summary}"
+        for (index, _), summary in bounded_map(
+            summarize, enumerate(chunks, 1), max_workers=STT_CHUNK_CONCURRENCY)
+        if summary
+    ]
+    if not summaries:
+        raise RuntimeError("모든 구간 요약에 실패했습니다")
+
+    return generate_with_retry(
+        model,
+        REDUCE_PROMPT.format(summaries="\n".join(summaries)),
+        parse=parse_json_response,
+    )
+
+
+def analyze_video_content(video_path, api_key):
+    if not api_key:
+        raise ValueError("유효한 Google API Key 필요")
+
+    try:
+        model = get_gemini_model(api_key, "gemini-2.5-flash")
+        duration = probe_duration(video_path)
+
+        # 길이를 모르면(webm 녹화 등) 분할 경로에서 실제 길이를 구해 판단
+        if duration is None or duration > STT_CHUNK_MIN_SEC:
+            result = analyze_long_audio(video_path, model, duration)
+        else:
+            result = analyze_single(video_path, model)
 
         return {
             "summary": result.get("summary", ""),
@@ -312,7 +732,3 @@ def analyze_video_content(video_path, api_key):
 
     except Exception as e:
         raise RuntimeError(f"Gemini 분석 오류: {e}")
-
-    finally:
-        if os.path.exists(audio_file_path):
-            os.remove(audio_file_path)
@@ -0,0 +1,103 @@
+"""
+프로세스 단위 Vision / Gemini 클라이언트 재사용
+
+요청마다 클라이언트를 만들면 gRPC 채널 생성 + 인증 로딩 비용이 매번 든다.
+worker 프로세스마다 한 번만 만들고 project id / API key 별로 따로 보관한다.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import grpc
+from google.cloud import vision
+import google.generativeai as genai
+from google.generativeai import client as genai_client
+
+# 요청마다 다른 API key 가 들어올 수 있으므로 보관 개수 제한
+MAX_GEMINI_MODELS = int(os.getenv("MAX_GEMINI_MODELS", "32"))
+
+_lock = threading.Lock()
+_pid = None
+_vision_clients = {}
+_gemini_models = OrderedDict()
+
+
+def _reset_after_fork():
+    """
+    fork 로 만들어진 worker 는 부모의 gRPC 채널을 쓰면 안 되므로 새로 만든다.
+    (_lock 을 잡은 상태에서 호출)
+    """
+    global _pid
+    if _pid != os.getpid():
+        _pid = os.getpid()
+        _vision_clients.clear()
+        _gemini_models.clear()
+
+
+# ============================================================
+# Google Vision
+# ============================================================
+def get_vision_client(project_id=None):
+    with _lock:
+        _reset_after_fork()
+
+        client = _vision_clients.get(project_id)
+        if client is None:
+            if project_id:
+                client = vision.ImageAnnotatorClient(client_options={"quota_project_id": project_id})
+            else:
+                client = vision.ImageAnnotatorClient()
+            _vision_clients[project_id] = client
+
+        return client
+
+
+# ============================================================
+# Gemini
+# ============================================================
+def get_gemini_model(api_key, model_name="gemini-2.5-flash"):
+    """
+    API key 별 GenerativeModel 재사용.
+    genai.configure 는 전역 설정이므로 새 key 일 때만 lock 안에서 호출하고,
+    그 시점의 클라이언트를 모델에 고정해 둔다.
+    """
+    key = (api_key, model_name)
+
+    with _lock:
+        _reset_after_fork()
+
+        model = _gemini_models.get(key)
+        if model is not None:
+            _gemini_models.move_to_end(key)
+            return model
+
+        genai.configure(api_key=api_key)
+        model = genai.GenerativeModel(model_name)
+        model._client = genai_client.get_default_generative_client()
+
+        _gemini_models[key] = model
+        if len(_gemini_models) > MAX_GEMINI_MODELS:
+            _gemini_models.popitem(last=False)
+
+        return model
+
+
+# ============================================================
+# 시작 시 미리 연결 (첫 요청의 채널 생성 비용 제거)
+# ============================================================
+def warm_up_clients(project_id=None, api_key=None, use_vision=True, timeout=5.0):
+    if use_vision:
+        try:
+            client = get_vision_client(project_id)
+            grpc.channel_ready_future(client.transport.grpc_channel).result(timeout=timeout)
+            print("🔥 Vision client ready", flush=True)
+        except Exception as e:
+            print(f"⚠️ Vision client warm-up 실패: {e}", flush=True)
+
+    if api_key:
+        try:
+            get_gemini_model(api_key)
+            print("🔥 Gemini client ready", flush=True)
+        except Exception as e:
+            print(f"⚠️ Gemini client warm-up 실패: {e}", flush=True)
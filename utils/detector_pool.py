@@ -0,0 +1,73 @@
+"""
+MediaPipe 검출기 풀 - 스레드마다 인스턴스를 빌려 쓰고 반납
+
+FaceMesh 등 MediaPipe 그래프는 여러 스레드가 동시에 process() 하면 안 되므로,
+최대 size 개까지만 만들어 두고 checkout / checkin 으로 공유한다.
+"""
+
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+
+class DetectorPool:
+    def __init__(self, factory, size=None):
+        self.factory = factory
+        self.size = max(int(size or os.cpu_count() or 1), 1)
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._idle = None
+        self._created = 0
+
+    def _reset_after_fork(self):
+        # 부모 프로세스에서 만든 그래프는 자식에서 쓰지 않는다 (_lock 안에서 호출)
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = queue.LifoQueue()
+            self._created = 0
+
+    def checkout(self, timeout=None):
+        with self._lock:
+            self._reset_after_fork()
+            idle = self._idle
+
+            try:
+                return idle.get_nowait()
+            except queue.Empty:
+                pass
+
+            # 아직 여유가 있으면 새로 생성 (lazy)
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+
+        if create:
+            try:
+                return self.factory()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        # 모두 사용 중이면 반납될 때까지 대기
+        try:
+            return idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("사용 가능한 검출기가 없습니다")
+
+    def checkin(self, detector):
+        with self._lock:
+            if self._pid == os.getpid():
+                self._idle.put(detector)
+
+    @contextmanager
+    def acquire(self, timeout=None):
+        detector = self.checkout(timeout)
+        try:
+            yield detector
+        finally:
+            self.checkin(detector)
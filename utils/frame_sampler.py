@@ -0,0 +1,94 @@
+"""
+영상 프레임 샘플러 - 필요한 프레임만 디코딩 (grab/retrieve + seek)
+
+cap.read()는 버리는 프레임까지 BGR 변환/복사를 하므로,
+건너뛸 프레임은 grab()만 하고 간격이 크면 seek 으로 바로 이동한다.
+"""
+
+import cv2
+
+# 이 간격(초)보다 멀리 떨어진 프레임은 grab 대신 seek
+SEEK_MIN_GAP_SEC = 2.0
+
+
+def open_video(video_path):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"비디오 파일을 열 수 없습니다: {video_path}")
+    return cap
+
+
+def get_video_info(video_path):
+    """
+    fps / 전체 프레임 수 / 길이(초). 프레임 수를 모르는 컨테이너(webm 등)는 0
+    """
+    cap = open_video(video_path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        total = max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 0)
+    finally:
+        cap.release()
+
+    return {"fps": fps, "frame_count": total, "duration": total / fps}
+
+
+def _interval_indices(fps, sec_interval, start_sec, end_sec):
+    step = max(int(fps * sec_interval), 1)
+    idx = int(start_sec * fps)
+    end_idx = int(end_sec * fps) if end_sec is not None else None
+
+    while end_idx is None or idx < end_idx:
+        yield idx
+        idx += step
+
+
+def sample_frames(video_path, sec_interval=None, timestamps=None,
+                  start_sec=0.0, end_sec=None, seek_gap_sec=SEEK_MIN_GAP_SEC):
+    """
+    (time_sec, frame) 를 하나씩 yield 하는 제너레이터
+
+    - sec_interval: 일정 간격 샘플링 (start_sec ~ end_sec)
+    - timestamps: 원하는 시각 목록 (순서 그대로, 정렬되지 않아도 됨)
+    """
+    if (sec_interval is None) == (timestamps is None):
+        raise ValueError("sec_interval 또는 timestamps 중 하나만 지정하세요")
+
+    cap = open_video(video_path)
+
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        seek_gap = max(int(seek_gap_sec * fps), 1)
+
+        if timestamps is None:
+            indices = _interval_indices(fps, sec_interval, start_sec, end_sec)
+        else:
+            indices = (max(int(round(t * fps)), 0) for t in timestamps)
+
+        pos = 0   # 다음 grab()이 반환할 프레임 번호 (None = 알 수 없음)
+
+        for idx in indices:
+            # 뒤로 가거나 멀리 떨어져 있으면 seek
+            if pos is None or idx < pos or idx - pos > seek_gap:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+                pos = idx
+
+            # 사이 프레임은 디코딩만 하고 변환/복사는 생략
+            while pos < idx:
+                if not cap.grab():
+                    break
+                pos += 1
+
+            if pos != idx or not cap.grab():
+                # 일정 간격 모드는 영상 끝, 시각 목록 모드는 해당 시각만 건너뜀
+                if timestamps is None:
+                    return
+                pos = None
+                continue
+
+            pos += 1
+            ok, frame = cap.retrieve()
+            if ok:
+                yield idx / fps, frame
+
+    finally:
+        cap.release()
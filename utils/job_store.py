@@ -0,0 +1,140 @@
+"""
+비동기 작업 저장소 (SQLite) - 서버 재시작 후에도 작업 상태 유지
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+STATUS_QUEUED = "queued"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class JobStore:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    payload TEXT,
+                    result TEXT,
+                    callback_url TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+
+    @contextmanager
+    def _connect(self):
+        # 요청 스레드 / dispatcher 스레드가 동시에 쓰므로 호출마다 연결
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # --------------------------------------------------------
+    # 작업 생성 / 상태 변경
+    # --------------------------------------------------------
+    def create(self, job_id, kind, payload, callback_url=None):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, payload, callback_url, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, STATUS_QUEUED, json.dumps(payload), callback_url, now, now),
+            )
+
+    def finish(self, job_id, result):
+        """
+        worker 결과 저장. payload(api_key 포함)는 완료 시 삭제
+        이미 끝난(만료된) 작업이면 바꾸지 않고 None
+        """
+        status = STATUS_FAILED if "error" in result else STATUS_DONE
+        with self._lock, self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, payload = NULL, updated_at = ? "
+                "WHERE id = ? AND status = ?",
+                (status, json.dumps(result), time.time(), job_id, STATUS_QUEUED),
+            )
+        return status if cur.rowcount else None
+
+    def requeue(self, job_id):
+        """재시작 후 다시 큐에 넣은 작업 - 만료 기준 시각을 지금으로"""
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def expire(self, older_than, error):
+        """
+        older_than(초) 넘게 queued 로 남은 작업을 실패 처리하고 목록을 반환
+        (결과가 사라졌거나 저장에 실패한 작업이 계속 queued 로 남지 않도록)
+        """
+        cutoff = time.time()
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, kind, payload, callback_url FROM jobs WHERE status = ? AND updated_at < ?",
+                (STATUS_QUEUED, cutoff - older_than),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET status = ?, result = ?, payload = NULL, updated_at = ? WHERE id = ?",
+                [
+                    (STATUS_FAILED, json.dumps({"id": r[0], "error": error}), cutoff, r[0])
+                    for r in rows
+                ],
+            )
+        return [self._job_row(r) for r in rows]
+
+    # --------------------------------------------------------
+    # 조회
+    # --------------------------------------------------------
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, kind, status, result, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return {
+            "job_id": row[0],
+            "type": row[1],
+            "status": row[2],
+            "result": json.loads(row[3]) if row[3] else None,
+            "created_at": row[4],
+            "updated_at": row[5],
+        }
+
+    def unfinished(self):
+        """
+        재시작 시 다시 큐에 넣을 작업 목록 (id, kind, payload, callback_url)
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, kind, payload, callback_url FROM jobs WHERE status = ? ORDER BY created_at",
+                (STATUS_QUEUED,),
+            ).fetchall()
+
+        return [self._job_row(r) for r in rows]
+
+    @staticmethod
+    def _job_row(r):
+        return {"id": r[0], "kind": r[1], "payload": json.loads(r[2]) if r[2] else {}, "callback_url": r[3]}
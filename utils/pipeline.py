@@ -0,0 +1,37 @@
+"""
+생산자/소비자 파이프라인 - 디코딩하는 즉시 API 호출 (back-pressure 포함)
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def bounded_map(fn, items, max_workers=10, max_pending=None):
+    """
+    items 를 하나씩 꺼내는 즉시 fn 을 스레드풀에 제출하고,
+    입력 순서대로 (item, result) 를 yield 한다.
+
+    진행 중인 작업이 max_pending 개에 도달하면 가장 오래된 결과를
+    기다린 뒤에 다음 item 을 꺼낸다 → 메모리에 쌓이는 프레임 수가 제한됨.
+    소비자가 중간에 멈추면(early exit) 대기 중인 작업은 취소된다.
+    """
+    max_pending = max_pending or max_workers * 2
+    pending = deque()
+    exe = ThreadPoolExecutor(max_workers=max_workers)
+
+    try:
+        for item in items:
+            pending.append((item, exe.submit(fn, item)))
+
+            while len(pending) >= max_pending:
+                done_item, future = pending.popleft()
+                yield done_item, future.result()
+
+        while pending:
+            done_item, future = pending.popleft()
+            yield done_item, future.result()
+
+    finally:
+        for _, future in pending:
+            future.cancel()
+        exe.shutdown(wait=False, cancel_futures=True)
@@ -1,17 +1,139 @@
-import boto3
+"""
+S3 업로드 공용 모듈 - 프로세스당 클라이언트 1개 + multipart 병렬 업로드
+
+- 파일 업로드: upload_file
+- ffmpeg 출력 스트리밍 업로드: upload_command_output (인코딩과 업로드를 동시에 진행)
+S3_ENDPOINT_URL 을 지정하면 moto / MinIO 같은 로컬 S3 로 업로드한다.
+"""
+
 import os
-from datetime import datetime
+import threading
+import subprocess
 
-s3 = boto3.client("s3")
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+S3_BUCKET = os.getenv("AWS_BUCKET_NAME", "woorizip-local-files")
+S3_REGION = os.getenv("AWS_REGION", "ap-northeast-2")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+
+MB = 1024 * 1024
+S3_MULTIPART_THRESHOLD_MB = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "8"))
+S3_MULTIPART_CHUNK_MB = int(os.getenv("S3_MULTIPART_CHUNK_MB", "8"))
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "8"))
+
+transfer_config = TransferConfig(
+    multipart_threshold=S3_MULTIPART_THRESHOLD_MB * MB,
+    multipart_chunksize=S3_MULTIPART_CHUNK_MB * MB,
+    max_concurrency=S3_MAX_CONCURRENCY,
+)
+
+_lock = threading.Lock()
+_pid = None
+_client = None
+
+
+# ============================================================
+# 클라이언트 (프로세스당 1개, fork 후 재생성)
+# ============================================================
+def get_s3_client():
+    global _pid, _client
+
+    with _lock:
+        if _client is None or _pid != os.getpid():
+            _pid = os.getpid()
+            _client = boto3.client(
+                "s3",
+                region_name=S3_REGION,
+                endpoint_url=S3_ENDPOINT_URL,
+                # multipart 파트를 동시에 올릴 수 있도록 연결 풀을 넉넉하게
+                config=Config(max_pool_connections=S3_MAX_CONCURRENCY * 2),
+            )
+        return _client
 
-def upload_to_s3(file_path, key_prefix="shorts"):
-    bucket = os.environ.get("AWS_BUCKET_NAME")
-    region = os.environ.get("AWS_REGION")
 
-    filename = os.path.basename(file_path)
-    key = f"{key_prefix}/{filename}"
+def object_url(key, bucket=S3_BUCKET):
+    if S3_ENDPOINT_URL:
+        return f"{S3_ENDPOINT_URL.rstrip('/')}/{bucket}/{key}"
+    return f"https://{bucket}.s3.{S3_REGION}.amazonaws.com/{key}"
 
-    s3.upload_file(file_path, bucket, key, ExtraArgs={'ContentType': 'video/mp4'})
 
-    # 업로드 완료 후 퍼블릭 URL 구성
-    return f"https://{bucket}.s3.{region}.amazonaws.com/{key}"
+# ============================================================
+# 업로드
+# ============================================================
+def upload_file(file_path, key, content_type="video/mp4", bucket=S3_BUCKET):
+    get_s3_client().upload_file(
+        file_path, bucket, key,
+        ExtraArgs={"ContentType": content_type},
+        Config=transfer_config,
+    )
+    return object_url(key, bucket)
+
+
+def upload_command_output(cmd, key, content_type="video/mp4", bucket=S3_BUCKET):
+    """
+    cmd(stdout 으로 출력하는 ffmpeg 등)를 실행하면서 출력을 바로 multipart 업로드.
+    명령이 실패하면 올라간 객체를 지우고 RuntimeError.
+    """
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    # stderr 파이프가 가득 차서 멈추지 않도록 별도 스레드에서 계속 읽음
+    stderr = []
+    drain = threading.Thread(target=lambda: stderr.append(proc.stderr.read()), daemon=True)
+    drain.start()
+
+    try:
+        get_s3_client().upload_fileobj(
+            proc.stdout, bucket, key,
+            ExtraArgs={"ContentType": content_type},
+            Config=transfer_config,
+        )
+    except Exception:
+        proc.kill()
+        raise
+    finally:
+        returncode = proc.wait()
+        drain.join()
+        proc.stdout.close()
+        proc.stderr.close()
+
+    if returncode != 0:
+        delete_object(key, bucket)
+        message = b"".join(stderr).decode(errors="ignore")[-500:]
+        raise RuntimeError(f"{cmd[0]} 실패: {message}")
+
+    return object_url(key, bucket)
+
+
+def object_exists(key, bucket=S3_BUCKET):
+    """
+    True / False, 확인할 수 없으면 None
+    (PutObject 만 허용된 버킷은 head_object 가 403 → 없는 것으로 보고 새로 업로드)
+    """
+    try:
+        get_s3_client().head_object(Bucket=bucket, Key=key)
+        return True
+    except ClientError as e:
+        code = e.response.get("Error", {}).get("Code")
+        if code in ("404", "NoSuchKey", "NotFound"):
+            return False
+        if code in ("403", "AccessDenied", "Forbidden"):
+            return None
+        raise
+
+
+def delete_object(key, bucket=S3_BUCKET):
+    try:
+        get_s3_client().delete_object(Bucket=bucket, Key=key)
+    except Exception as e:
+        print(f"⚠️ S3 객체 삭제 실패 ({key}): {e}", flush=True)
+
+
+def upload_to_s3(file_path, key_prefix="shorts"):
+    key = f"{key_prefix}/{os.path.basename(file_path)}"
+    return upload_file(file_path, key)
@@ -0,0 +1,68 @@
+"""
+공유 메모리 전송 - 디코딩된 프레임(ndarray)을 worker 에 pickle 없이 전달
+
+보내는 쪽(Flask 프로세스)이 SharedMemory 블록을 만들어 데이터를 한 번 쓰고,
+큐에는 작은 descriptor(dict) 만 넣는다. worker 는 이름으로 붙어서 바로 읽는다.
+
+블록의 수명은 보내는 쪽이 관리한다. (결과를 받거나 타임아웃되면 unlink)
+→ worker 가 죽어도 블록이 남지 않고, worker 는 close 만 하면 된다.
+"""
+
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedPayload:
+    """
+    보내는 쪽: with SharedPayload.from_array(frame) as payload:
+                   submit({"frame": payload.descriptor, ...})
+    """
+
+    def __init__(self, size, meta):
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.descriptor = dict(meta, shm=self.shm.name, size=size)
+
+    @classmethod
+    def from_array(cls, arr):
+        arr = np.ascontiguousarray(arr)
+        payload = cls(arr.nbytes, {"shape": arr.shape, "dtype": arr.dtype.str})
+        np.ndarray(arr.shape, arr.dtype, buffer=payload.shm.buf)[...] = arr
+        return payload
+
+    def close(self):
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@contextmanager
+def attach(descriptor):
+    """
+    받는 쪽: descriptor → ndarray (공유 메모리를 그대로 가리킴)
+    with 블록 안에서만 유효하므로 밖으로 가지고 나갈 값은 복사해야 한다.
+    """
+    # worker 는 spawn 으로 만들어져 Flask 프로세스와 같은 resource_tracker 를 쓴다.
+    # 여기서 등록 해제하면 보내는 쪽 등록까지 지워지므로 그대로 두고, unlink 는 보내는 쪽에 맡긴다.
+    shm = shared_memory.SharedMemory(name=descriptor["shm"])
+
+    data = np.ndarray(descriptor["shape"], np.dtype(descriptor["dtype"]), buffer=shm.buf)
+
+    try:
+        yield data
+    finally:
+        del data
+        try:
+            shm.close()
+        except BufferError:
+            # 호출한 쪽이 아직 view 를 들고 있으면 GC 때 해제됨
+            pass
@@ -0,0 +1,88 @@
+"""
+숏츠 결과 인덱스 (SQLite) - 같은 영상 / 같은 구간은 다시 분석·렌더링하지 않음
+
+- segments: 탐지 키(원본 해시 + 탐지 설정) → 반려동물 구간
+- renders : 렌더 키(원본 해시 + 구간 + 인코딩 설정) → S3 URL
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class ShortsIndex:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS segments (
+                    detect_key TEXT PRIMARY KEY,
+                    segments TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS renders (
+                    render_key TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+
+    @contextmanager
+    def _connect(self):
+        # 여러 worker 프로세스가 같은 파일을 쓰므로 호출마다 연결
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # --------------------------------------------------------
+    # 탐지 결과
+    # --------------------------------------------------------
+    def get_segments(self, detect_key):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT segments FROM segments WHERE detect_key = ?", (detect_key,)
+            ).fetchone()
+        return [tuple(seg) for seg in json.loads(row[0])] if row else None
+
+    def put_segments(self, detect_key, segments):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO segments (detect_key, segments, created_at) VALUES (?, ?, ?)",
+                (detect_key, json.dumps(segments), time.time()),
+            )
+
+    # --------------------------------------------------------
+    # 렌더 결과
+    # --------------------------------------------------------
+    def get_url(self, render_key):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT url FROM renders WHERE render_key = ?", (render_key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put_url(self, render_key, url):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO renders (render_key, url, created_at) VALUES (?, ?, ?)",
+                (render_key, url, time.time()),
+            )
@@ -0,0 +1,113 @@
+"""
+업로드 처리 - 작은 파일은 메모리에, 큰 파일은 scratch 디렉토리에 바로 저장
+
+werkzeug 가 multipart 를 파싱할 때 쓰는 스트림을 교체해서,
+큰 영상은 처음부터 이름 있는 파일(UPLOAD_SCRATCH_DIR)로 받는다.
+→ file.save() 로 다시 복사하지 않고 그 경로를 그대로 worker 에 넘긴다.
+요청이 끝나면(request.close) 가져가지 않은 scratch 파일은 모두 삭제된다.
+"""
+
+import os
+import shutil
+import mimetypes
+import tempfile
+from io import BytesIO
+from uuid import uuid4
+from flask import Request, request
+
+# tmpfs(/dev/shm 등)를 지정하면 디스크를 거치지 않음
+UPLOAD_SCRATCH_DIR = os.getenv("UPLOAD_SCRATCH_DIR", tempfile.gettempdir())
+# 이 크기 이하 업로드는 메모리(BytesIO)에 보관
+UPLOAD_MEMORY_MAX = int(os.getenv("UPLOAD_MEMORY_MAX", str(4 * 1024 * 1024)))
+
+os.makedirs(UPLOAD_SCRATCH_DIR, exist_ok=True)
+
+
+def file_ext(filename, default):
+    if filename and "." in filename:
+        return filename.rsplit(".", 1)[-1].lower()
+    return default
+
+
+class UploadRequest(Request):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scratch_paths = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= UPLOAD_MEMORY_MAX:
+            return BytesIO()
+
+        # 확장자를 유지해야 mimetypes / ffmpeg 가 형식을 판단할 수 있음
+        stream = tempfile.NamedTemporaryFile(
+            "w+b", dir=UPLOAD_SCRATCH_DIR, prefix="upload_",
+            suffix=f".{file_ext(filename, 'bin')}", delete=False,
+        )
+        self.scratch_paths.append(stream.name)
+        return stream
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            for path in self.scratch_paths:
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+# ============================================================
+# 핸들러용 헬퍼
+# ============================================================
+def is_image(filename):
+    mime, _ = mimetypes.guess_type(filename or "")
+    return bool(mime and mime.startswith("image"))
+
+
+def in_memory(file):
+    return isinstance(file.stream, BytesIO)
+
+
+def upload_bytes(file):
+    """메모리 업로드의 내용 (디스크를 거치지 않음)"""
+    return file.stream.getvalue()
+
+
+def upload_path(file, default_ext="mp4"):
+    """
+    업로드 파일의 경로. 큰 파일은 이미 scratch 에 있으므로 그대로 반환하고,
+    메모리에 있던 작은 파일만 scratch 에 한 번 쓴다. (요청 종료 시 삭제)
+    """
+    if in_memory(file):
+        path = os.path.join(
+            UPLOAD_SCRATCH_DIR,
+            f"upload_{uuid4().hex}.{file_ext(file.filename, default_ext)}",
+        )
+        with open(path, "wb") as f:
+            f.write(upload_bytes(file))
+        request.scratch_paths.append(path)
+        return path
+
+    file.stream.flush()
+    return file.stream.name
+
+
+def keep_upload(file, dest_path):
+    """
+    요청이 끝난 뒤에도 필요한 업로드(비동기 작업)를 dest_path 로 옮긴다.
+    같은 파일시스템이면 rename 만 일어난다.
+    """
+    if in_memory(file):
+        with open(dest_path, "wb") as f:
+            f.write(upload_bytes(file))
+        return dest_path
+
+    file.stream.flush()
+    src = file.stream.name
+    try:
+        os.replace(src, dest_path)
+    except OSError:
+        shutil.move(src, dest_path)
+
+    if src in request.scratch_paths:
+        request.scratch_paths.remove(src)
+    return dest_path
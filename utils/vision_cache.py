@@ -0,0 +1,108 @@
+"""
+Vision API 결과 캐시 - 이미지 내용 해시 기반 (메모리 LRU + 선택적 디스크)
+
+같은 사진/영상이 재업로드되면 Vision 호출 없이 이전 결과를 사용한다.
+값은 JSON 으로 저장 가능한 형태(list/dict)만 넣는다.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+VISION_CACHE_SIZE = int(os.getenv("VISION_CACHE_SIZE", "4096"))
+VISION_CACHE_DIR = os.getenv("VISION_CACHE_DIR")   # 지정 시 디스크에도 저장
+
+
+class VisionCache:
+    def __init__(self, max_entries=VISION_CACHE_SIZE, disk_dir=VISION_CACHE_DIR):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(content, feature):
+        return f"{feature}-{hashlib.sha256(content).hexdigest()}"
+
+    # --------------------------------------------------------
+    # 디스크 저장소 (key 앞 2글자로 디렉토리 분산)
+    # --------------------------------------------------------
+    def _disk_path(self, key):
+        digest = key.rsplit("-", 1)[-1]
+        return os.path.join(self.disk_dir, digest[:2], f"{key}.json")
+
+    def _load_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_disk(self, key, value):
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+
+    # --------------------------------------------------------
+    # 조회 / 저장
+    # --------------------------------------------------------
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        value = self._load_disk(key)
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, value)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+
+        if self.disk_dir:
+            try:
+                self._save_disk(key, value)
+            except OSError as e:
+                print(f"⚠️ Vision cache 디스크 저장 실패: {e}", flush=True)
+
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+# 프로세스 공용 인스턴스
+vision_cache = VisionCache()
@@ -0,0 +1,80 @@
+"""
+Worker 결과 라우팅 - task id 기반 Future 매칭
+"""
+
+import threading
+from uuid import uuid4
+from concurrent.futures import Future
+
+
+# ============================================================
+# 결과 큐 1개를 여러 요청이 공유해도 id로 정확히 매칭
+# ============================================================
+class ResultDispatcher:
+    """
+    task_q 로 작업을 넣고, result_q 에서 나오는 결과를
+    task id 로 찾아 해당 요청의 Future 에 전달한다.
+    """
+
+    def __init__(self, task_q, result_q, name="worker"):
+        self.task_q = task_q
+        self.result_q = result_q
+        self.name = name
+
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # --------------------------------------------------------
+    # 결과 수신 스레드 (Flask 프로세스에서 1회만 시작)
+    # --------------------------------------------------------
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name=f"{self.name}-dispatcher", daemon=True
+            )
+            self._thread.start()
+
+    # --------------------------------------------------------
+    # 작업 제출 → Future 반환
+    # --------------------------------------------------------
+    def submit(self, task):
+        self.start()
+
+        task_id = task.setdefault("id", uuid4().hex)
+        future = Future()
+
+        with self._lock:
+            self._pending[task_id] = future
+
+        self.task_q.put(task)
+        return future
+
+    # --------------------------------------------------------
+    # 타임아웃 등으로 더 이상 기다리지 않는 작업 정리
+    # --------------------------------------------------------
+    def discard(self, task_id):
+        with self._lock:
+            self._pending.pop(task_id, None)
+
+    def _resolve(self, result):
+        task_id = result.get("id")
+
+        with self._lock:
+            future = self._pending.pop(task_id, None)
+
+        if future is None:
+            print(f"⚠️ [{self.name} dispatcher] 대기 중인 요청 없음: id={task_id}", flush=True)
+            return
+
+        future.set_result(result)
+
+    def _run(self):
+        while True:
+            result = self.result_q.get()
+            try:
+                self._resolve(result)
+            except Exception as e:
+                print(f"🔥 [{self.name} dispatcher] 결과 전달 실패: {e}", flush=True)
@@ -0,0 +1,36 @@
+import traceback
+from models.face_arrange import detect_landmarks
+from workers.pool import mark_current
+from utils.shm_transport import attach
+
+
+def run_face_worker(face_q, face_res_q, current=None):
+    """
+    공유 메모리로 받은 프레임 → FaceMesh landmark 배열
+    (세션 상태 판정은 Flask 프로세스에서 evaluate_landmarks 로 처리)
+    """
+    print("🔥 Face Worker started.", flush=True)
+
+    while True:
+        task = face_q.get()
+
+        # 종료 신호
+        if task is None:
+            print("🛑 Face Worker stopped.", flush=True)
+            break
+
+        task_id = task.get("id")
+        mark_current(current, task_id)
+
+        try:
+            with attach(task["frame"]) as frame:
+                points = detect_landmarks(frame)
+
+            face_res_q.put({"id": task_id, "points": points})
+
+        except Exception as e:
+            traceback.print_exc()
+            face_res_q.put({"id": task_id, "error": str(e)})
+
+        finally:
+            mark_current(current, None)
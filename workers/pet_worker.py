@@ -1,34 +1,57 @@
 from models.pet_daily import classify_media
-from models.pet_shorts import find_pet_segments, compile_pet_shorts
+from models.pet_shorts import find_pet_segments_cached, compile_pet_shorts, hash_file
+from workers.pool import mark_current
+from utils.clients import warm_up_clients
+from utils.vision_cache import vision_cache
 
-def run_pet_worker(task_q, result_q):
+def run_pet_worker(task_q, result_q, current=None):
     print("🔥 Pet Worker started.")
+    warm_up_clients()
 
     while True:
         task = task_q.get()
+
+        # 종료 신호
+        if task is None:
+            print("🛑 Pet Worker stopped.", flush=True)
+            break
+
+        task_id = task.get("id")
         mode = task["mode"]
-        video_path = task["path"]
+        video_path = task.get("path")
+        mark_current(current, task_id)
 
         try:
             # DAILY 모드
             if mode == "daily":
-                res = classify_media(video_path)
-                result_q.put({"message": "success", "result": res})
+                if "content" in task:
+                    # 메모리로 받은 작은 사진
+                    res = classify_media(task["filename"] or "", content=task["content"])
+                else:
+                    res = classify_media(video_path)
+                result_q.put({"id": task_id, "message": "success", "result": res})
                 continue
 
             # SHORTS 모드
             if mode == "shorts":
-                segments = find_pet_segments(video_path)
-                output = compile_pet_shorts(video_path, segments)
+                # 같은 영상이면 탐지 / 렌더링 결과를 재사용 (원본 해시 기준)
+                source_hash = hash_file(video_path)
+                segments = find_pet_segments_cached(video_path, source_hash)
+                output = compile_pet_shorts(video_path, segments, source_hash=source_hash)
 
                 result_q.put({
+                    "id": task_id,
                     "message": "success",
                     "segments": segments,
                     "output_path": output
                 })
                 continue
 
-            result_q.put({"error": f"Unknown mode: {mode}"})
+            result_q.put({"id": task_id, "error": f"Unknown mode: {mode}"})
 
         except Exception as e:
-            result_q.put({"error": str(e)})
+            result_q.put({"id": task_id, "error": str(e)})
+
+        finally:
+            mark_current(current, None)
+            print(f"📊 [Pet Worker] Vision cache {vision_cache.stats()}", flush=True)
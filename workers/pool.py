@@ -0,0 +1,112 @@
+"""
+작업 종류별 Worker 프로세스 풀 - 공유 입력 큐 + 헬스 체크 + 자동 재시작
+"""
+
+import threading
+import multiprocessing
+
+# Flask 프로세스는 gRPC 채널(Vision / Gemini)과 여러 스레드를 가진 상태라 fork 하면 안 됨
+# → worker 와 worker 가 쓰는 큐 / 공유 슬롯은 모두 spawn 컨텍스트로 만든다.
+mp_context = multiprocessing.get_context("spawn")
+
+
+# ============================================================
+# Worker 쪽 헬퍼: 현재 처리 중인 task id 기록
+# ============================================================
+def mark_current(current, task_id):
+    """
+    풀이 넘겨준 공유 슬롯에 처리 중인 task id를 기록한다.
+    (프로세스가 죽었을 때 어떤 요청이 실패했는지 알리기 위함)
+    """
+    if current is None:
+        return
+    current.value = (task_id or "").encode()[:63]
+
+
+# ============================================================
+# Worker 풀
+# ============================================================
+class WorkerPool:
+    def __init__(self, target, task_q, result_q, size=1, name="worker", check_interval=2.0):
+        self.target = target
+        self.task_q = task_q
+        self.result_q = result_q
+        self.size = max(int(size), 1)
+        self.name = name
+        self.check_interval = check_interval
+
+        self._slots = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._monitor = None
+
+    # --------------------------------------------------------
+    # 시작 / 종료
+    # --------------------------------------------------------
+    def start(self):
+        with self._lock:
+            for idx in range(self.size):
+                self._slots.append({"proc": None, "current": mp_context.Array("c", 64), "restarts": 0})
+                self._spawn(idx)
+
+        self._monitor = threading.Thread(
+            target=self._watch, name=f"{self.name}-pool-monitor", daemon=True
+        )
+        self._monitor.start()
+        print(f"🔥 {self.name} pool started ({self.size} workers)", flush=True)
+
+    def stop(self, timeout=10):
+        self._stopped.set()
+        for _ in self._slots:
+            self.task_q.put(None)
+        for slot in self._slots:
+            slot["proc"].join(timeout)
+
+    def _spawn(self, idx):
+        slot = self._slots[idx]
+        slot["current"].value = b""
+
+        proc = mp_context.Process(
+            target=self.target,
+            args=(self.task_q, self.result_q),
+            kwargs={"current": slot["current"]},
+            name=f"{self.name}-{idx}",
+        )
+        proc.start()
+        slot["proc"] = proc
+
+    # --------------------------------------------------------
+    # 헬스 체크: 죽은 프로세스 재시작 + 처리 중이던 요청에 에러 전달
+    # --------------------------------------------------------
+    def _watch(self):
+        while not self._stopped.wait(self.check_interval):
+            with self._lock:
+                for idx, slot in enumerate(self._slots):
+                    proc = slot["proc"]
+                    if proc.is_alive():
+                        continue
+
+                    task_id = slot["current"].value.decode()
+                    print(f"🔥 [{proc.name}] 비정상 종료 (exitcode={proc.exitcode}) → 재시작", flush=True)
+
+                    if task_id:
+                        self.result_q.put({
+                            "id": task_id,
+                            "error": f"Worker crashed (exitcode={proc.exitcode})"
+                        })
+
+                    slot["restarts"] += 1
+                    self._spawn(idx)
+
+    def health(self):
+        with self._lock:
+            return [
+                {
+                    "name": slot["proc"].name,
+                    "pid": slot["proc"].pid,
+                    "alive": slot["proc"].is_alive(),
+                    "restarts": slot["restarts"],
+                    "current_task": slot["current"].value.decode() or None,
+                }
+                for slot in self._slots
+            ]
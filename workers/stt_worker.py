@@ -2,10 +2,13 @@ import os
 import json
 import traceback
 from models.thumb_stt import analyze_video_content
+from workers.pool import mark_current
+from utils.clients import warm_up_clients
 
 
-def run_stt_worker(stt_q, stt_res_q):
+def run_stt_worker(stt_q, stt_res_q, current=None):
     print("🔥 STT Worker started.", flush=True)
+    warm_up_clients(api_key=os.getenv("GEMINI_API_KEY"), use_vision=False)
 
     while True:
         try:
@@ -21,6 +24,7 @@ def run_stt_worker(stt_q, stt_res_q):
             api_key = task.get("api_key")
 
             print(f"🔍 [STT Worker] Processing ID={task_id}, file={video_path}", flush=True)
+            mark_current(current, task_id)
 
             # ============================================================
             # 1) STT + 요약 + 제목 생성
@@ -45,6 +49,9 @@ def run_stt_worker(stt_q, stt_res_q):
                     "error": str(e)
                 })
 
+            finally:
+                mark_current(current, None)
+
         except Exception as e:
             # 예상치 못한 전체 루프 에러 방지
             print("🔥 [STT Worker] Fatal Error in loop", flush=True)